@@ -1,21 +1,44 @@
 import os
 import json
-from dash import html, dcc
+import time
+import threading
+from flask import Response, request, stream_with_context
+from dash import html, dcc, Patch
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 
-ALUMNI_FILE = "data/alumni.json"
-os.makedirs("data", exist_ok=True)
-if not os.path.exists(ALUMNI_FILE):
-    with open(ALUMNI_FILE, "w", encoding="utf-8") as f:
-        json.dump([], f, ensure_ascii=False)
+import alumni_store
+
+# Open alumni pages hold an event stream instead of polling. Streams are
+# closed after STREAM_SECONDS (the browser reconnects) so a worker thread is
+# never pinned forever; the log is stat-checked every STREAM_POLL seconds.
+STREAM_SECONDS = 25
+STREAM_POLL = 0.5
+STREAM_PING = 10
+# Each stream holds a request thread; past this many per worker process the
+# browser is refused at once (503) and checks /alumni/changes every few
+# seconds instead, which never holds a thread, trying for a stream now and
+# then. So any number of open tabs see new names, the first few at once.
+MAX_STREAMS = int(os.environ.get("MAX_ALUMNI_STREAMS", "4"))
+
+_streams = threading.BoundedSemaphore(MAX_STREAMS)
+
+# The page shows the newest names (or search results) a page at a time.
+ALUMNI_PAGE_SIZE = 50
 
 def layout():
     return html.Div([
         dbc.Container([
             html.H2("KenSAP Alumni", className="text-center", style={"marginTop": "30px"}),
             html.Hr(),
-            html.Div(id="alumni-list", style={"marginTop": "20px"}),
+            dbc.Input(id="alumni-search", placeholder="Search alumni by name...", type="search",
+                      debounce=300, style={"marginTop": "10px"}),
+            html.Div([
+                html.P("No alumni yet.", id="alumni-empty", style={"display": "none"}),
+                html.Ul(id="alumni-list"),
+                dbc.Button("Show more", id="alumni-more", color="secondary", n_clicks=0,
+                           style=more_style(None)),
+            ], style={"marginTop": "20px"}),
             html.Hr(),
             html.Div([
                 html.H4("Add Yourself to Alumni List:"),
@@ -23,36 +46,134 @@ def layout():
                 dbc.Button("Add Me", id="add-alumni-button", color="primary", style={"marginTop": "10px"}),
                 html.Div(id="alumni-output", style={"marginTop": "15px", "color": "green"})
             ], style={"marginTop": "30px"}),
-            # short interval to refresh the list so all users see updates quickly
-            dcc.Interval(id="alumni-refresh", interval=1000, n_intervals=0)
+            # version of the list on screen, set by the browser when the list
+            # must be rendered again, and where the next "Show more" page starts
+            dcc.Store(id="alumni-version"),
+            dcc.Store(id="alumni-refresh"),
+            dcc.Store(id="alumni-cursor"),
+            html.Div(id="alumni-stream", style={"display": "none"})
         ])
     ])
 
-def safe_load_alumni():
-    try:
-        with open(ALUMNI_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return data
-    except Exception:
-        pass
-    return []
+def more_style(cursor):
+    return {"display": "block" if cursor else "none", "marginTop": "10px"}
+
+def alumni_page(query, cursor=None):
+    """Return (names, cursor for the next page or None) for the list on screen.
+
+    Without a query the newest names come first; with one, the names with a
+    word starting with it, alphabetically.
+    """
+    cursor = cursor or {}
+    if query:
+        names, after = alumni_store.search(query, after=cursor.get("after"), limit=ALUMNI_PAGE_SIZE)
+        return names, ({"after": after} if after else None)
+    names, before = alumni_store.recent(before=cursor.get("before"), limit=ALUMNI_PAGE_SIZE)
+    return names, ({"before": before} if before else None)
+
+# -----------------------------
+# Change notification
+# -----------------------------
+# Names are only ever appended, so the number of names is a version counter
+# every worker agrees on, and the delta since version v is every name after
+# the first v.
+def delta(since, added, version):
+    return json.dumps({"since": since, "version": version, "added": added}, ensure_ascii=False)
+
+def event_stream(since):
+    yield f"retry: {STREAM_POLL * 4 * 1000:.0f}\n\n"
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < STREAM_SECONDS:
+        added, version = alumni_store.added_since(since)
+        if version != since:
+            yield f"data: {delta(since, added, version)}\n\n"
+            since = version
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > STREAM_PING:
+            # a write to a closed connection ends the stream and frees its slot
+            yield "event: ping\ndata: {}\n\n"
+            last_sent = time.monotonic()
+        time.sleep(STREAM_POLL)
+
+def register_routes(server):
+    @server.route("/alumni/events")
+    def alumni_events():
+        if not _streams.acquire(blocking=False):
+            return Response("Too many open streams.", status=503, headers={"Retry-After": "10"})
+        try:
+            since = request.args.get("since", type=int)
+            if since is None:
+                since = alumni_store.version()
+            response = Response(
+                stream_with_context(event_stream(since)),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        except BaseException:
+            _streams.release()
+            raise
+        response.call_on_close(_streams.release)  # also runs if the client disconnects
+        return response
 
-def safe_save_alumni(alumni):
-    with open(ALUMNI_FILE, "w", encoding="utf-8") as f:
-        json.dump(alumni, f, ensure_ascii=False)
+    @server.route("/alumni/changes")
+    def alumni_changes():
+        # For tabs refused a stream: 204 if nothing was added after `since`,
+        # else the same delta a stream would send.
+        since = request.args.get("since", type=int)
+        added, version = alumni_store.added_since(since)
+        if version == since:
+            return Response(status=204, headers={"Cache-Control": "no-cache"})
+        return Response(delta(since, added, version), mimetype="application/json",
+                        headers={"Cache-Control": "no-cache"})
 
 def register_callbacks(app):
     @app.callback(
         Output("alumni-list", "children"),
-        Input("alumni-refresh", "n_intervals")
+        Output("alumni-empty", "children"),
+        Output("alumni-empty", "style"),
+        Output("alumni-version", "data"),
+        Output("alumni-cursor", "data"),
+        Output("alumni-more", "style"),
+        Input("alumni-refresh", "data"),
+        Input("alumni-search", "value"),
+        prevent_initial_call=True  # the page asks for its first render when first shown
+    )
+    def display_alumni(refresh, query):
+        # New names pushed by /alumni/events are prepended in the browser
+        # (subscribeAlumni in main.js); this renders the first page.
+        query = (query or "").strip()
+        version = alumni_store.version()
+        names, cursor = alumni_page(query, {"before": version} if not query else None)
+        empty = f'No alumni match "{query}".' if query else "No alumni yet."
+        return ([html.Li(name) for name in names], empty,
+                {"display": "none" if names else "block"},
+                version, cursor, more_style(cursor))
+
+    @app.callback(
+        Output("alumni-list", "children", allow_duplicate=True),
+        Output("alumni-cursor", "data", allow_duplicate=True),
+        Output("alumni-more", "style", allow_duplicate=True),
+        Input("alumni-more", "n_clicks"),
+        State("alumni-search", "value"),
+        State("alumni-cursor", "data"),
+        prevent_initial_call=True
+    )
+    def load_more_alumni(n_clicks, query, cursor):
+        if not cursor:
+            return Patch(), None, more_style(None)
+        names, cursor = alumni_page((query or "").strip(), cursor)
+        more = Patch()
+        more.extend([html.Li(name) for name in names])
+        return more, cursor, more_style(cursor)
+
+    # Opens (or keeps) the browser's EventSource for /alumni/events while
+    # the page (shown and hidden by the router in app.py) is visible.
+    app.clientside_callback(
+        ClientsideFunction(namespace="kensap", function_name="subscribeAlumni"),
+        Output("alumni-stream", "children"),
+        Input("alumni-version", "data"),
+        Input("page-alumni", "style")
     )
-    def display_alumni(_):
-        alumni = safe_load_alumni()
-        if not alumni:
-            return html.P("No alumni yet.")
-        # Show newest on top (list is stored newest-first already)
-        return html.Ul([html.Li(name) for name in alumni])
 
     @app.callback(
         Output("alumni-output", "children"),
@@ -67,19 +188,13 @@ def register_callbacks(app):
             return "Please enter a valid username.", ""
         name = name.strip()
 
-        alumni = safe_load_alumni()
-
-        # Prevent duplicates (case-insensitive)
-        lower_names = {a.lower() for a in alumni}
-        if name.lower() in lower_names:
-            return f"{name} is already in the alumni list.", ""
-
-        # Insert newest on top
-        alumni.insert(0, name)
+        # Duplicate check (case-insensitive) and append happen under one lock
         try:
-            safe_save_alumni(alumni)
+            added = alumni_store.add_name(name)
         except Exception as e:
             return f"Error saving name: {e}", ""
+        if not added:
+            return f"{name} is already in the alumni list.", ""
 
-        # Return success message and clear input (list will refresh via Interval)
+        # Return success message and clear input (open pages get the new name via /alumni/events)
         return f"{name} has been added to the alumni list!", ""
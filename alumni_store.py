@@ -0,0 +1,215 @@
+import os
+import json
+import bisect
+import threading
+from datetime import datetime
+
+import datastore
+from metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still single writes, just unlocked
+    fcntl = None
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# The directory is an append-only log (data/alumni.jsonl, one name per line,
+# oldest first). Every process keeps an index built from it and catches up
+# by reading only the lines appended since its last look:
+#   - a case-folded name -> position dict, for O(1) duplicate checks
+#   - a sorted list of (word prefix key, position), for typeahead search
+# Names are never removed, so the number of names is a version counter
+# every worker agrees on.
+ALUMNI_LOG = "data/alumni.jsonl"
+LEGACY_ALUMNI_FILE = "data/alumni.json"
+
+os.makedirs("data", exist_ok=True)
+
+# -----------------------------
+# Names
+# -----------------------------
+def fold(name):
+    """Key used for duplicate checks and search: case-folded, single spaces."""
+    return " ".join(name.casefold().split())
+
+def search_keys(folded):
+    """The full name and the rest of it from each later word, so "nta"
+    finds "Stephen Ntayia"."""
+    words = folded.split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+# -----------------------------
+# Index
+# -----------------------------
+_lock = threading.RLock()
+_index = {
+    "inode": None,
+    "offset": 0,    # bytes of the log already read
+    "names": [],    # oldest first
+    "folded": {},   # fold(name) -> position in names
+    "keys": [],     # sorted (search key, position)
+}
+
+def _reset():
+    _index.update(inode=None, offset=0, names=[], folded={}, keys=[])
+
+def _add_to_index(name, new_keys):
+    folded = fold(name)
+    if not folded or folded in _index["folded"]:
+        return  # blank, or a duplicate written by an older version
+    position = len(_index["names"])
+    _index["names"].append(name)
+    _index["folded"][folded] = position
+    new_keys.extend((key, position) for key in search_keys(folded))
+
+def migrate_legacy_json():
+    """Create the log from data/alumni.json (a list, newest first) once."""
+    if os.path.exists(ALUMNI_LOG):
+        return
+    legacy = []
+    if os.path.exists(LEGACY_ALUMNI_FILE):
+        try:
+            with open(LEGACY_ALUMNI_FILE, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except ValueError:
+            legacy = []
+    if not isinstance(legacy, list):
+        legacy = []
+    try:
+        # never replaces a log another worker just created
+        with datastore.atomic_write(ALUMNI_LOG, replace=False) as f:
+            for name in reversed(legacy):
+                if isinstance(name, str) and name.strip():
+                    f.write(json.dumps({"name": name.strip()}, ensure_ascii=False) + "\n")
+    except FileExistsError:
+        pass
+
+@timed("alumni", "read")
+def refresh():
+    """Bring this process's index up to date with the log."""
+    with _lock:
+        try:
+            st = os.stat(ALUMNI_LOG)
+        except FileNotFoundError:
+            migrate_legacy_json()
+            st = os.stat(ALUMNI_LOG)
+        if st.st_ino != _index["inode"] or st.st_size < _index["offset"]:
+            _reset()  # new or rewritten file
+            _index["inode"] = st.st_ino
+        if st.st_size == _index["offset"]:
+            return
+        with open(ALUMNI_LOG, "rb") as f:
+            f.seek(_index["offset"])
+            data = f.read(st.st_size - _index["offset"])
+        end = data.rfind(b"\n") + 1  # a line still being written waits for next time
+        new_keys = []
+        for line in data[:end].splitlines():
+            try:
+                name = json.loads(line)["name"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if isinstance(name, str):
+                _add_to_index(name, new_keys)
+        if new_keys:
+            # one sort per catch-up (cheap: the existing keys are one sorted run)
+            _index["keys"].extend(new_keys)
+            _index["keys"].sort()
+        _index["offset"] += end
+
+# -----------------------------
+# Reads
+# -----------------------------
+def version():
+    refresh()
+    return len(_index["names"])
+
+def exists(name):
+    refresh()
+    return fold(name) in _index["folded"]
+
+def recent(before=None, limit=50):
+    """Return (names newest first, cursor for the next page or None).
+
+    The cursor is a position in the log, so names added meanwhile never
+    shift the pages that follow.
+    """
+    refresh()
+    with _lock:
+        names = _index["names"]
+        end = len(names) if before is None else min(before, len(names))
+        start = max(0, end - limit)
+        return names[start:end][::-1], (start or None)
+
+def added_since(since):
+    """Return (names added after version `since` newest first, current version).
+
+    The names are None if `since` is ahead of this directory.
+    """
+    refresh()
+    with _lock:
+        names = _index["names"]
+        if since is None or since > len(names):
+            return None, len(names)
+        return names[since:][::-1], len(names)
+
+@timed("alumni", "search")
+def search(query, after=None, limit=50):
+    """Return (names matching a word prefix, in alphabetical order, cursor).
+
+    The cursor is the folded name of the last result, for the next page.
+    """
+    refresh()
+    prefix = fold(query)
+    with _lock:
+        keys, names = _index["keys"], _index["names"]
+        found = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            found.add(keys[i][1])
+            i += 1
+        ordered = sorted((fold(names[p]), names[p]) for p in found)
+    if after is not None:
+        ordered = [item for item in ordered if item[0] > after]
+    page = ordered[:limit]
+    cursor = page[-1][0] if len(ordered) > limit else None
+    return [name for _, name in page], cursor
+
+# -----------------------------
+# Writes
+# -----------------------------
+@timed("alumni", "write")
+def add_names(names):
+    """Append every name not already in the directory; return those added.
+
+    The log is locked while the index catches up and the new lines are
+    written, so two workers can never both add the same name.
+    """
+    refresh()  # creates the log from the legacy file if needed
+    with _lock, open(ALUMNI_LOG, "a", encoding="utf-8") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        refresh()
+        added, seen = [], set()
+        for name in names:
+            name = name.strip()
+            folded = fold(name)
+            if not folded or folded in _index["folded"] or folded in seen:
+                continue
+            seen.add(folded)
+            added.append(name)
+        if added:
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            f.write("".join(json.dumps({"name": name, "added_at": now}, ensure_ascii=False) + "\n"
+                            for name in added))
+            f.flush()
+            os.fsync(f.fileno())
+        refresh()
+    return added
+
+def add_name(name):
+    """Add one name; False if it (or a different-case spelling) is already listed."""
+    return bool(add_names([name]))
+
+refresh()
@@ -1,28 +1,28 @@
 import os
-import json
 import dash
 from dash import html, dcc, callback_context
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 
 import homepage
 import gallery
 import alumni
 import profile
+import thumbnails
+import uploads
+import static_assets
+import user_store
+from layout_cache import pages
+import metrics
+import warmup
 
 # -----------------------------
 # Initialize app
 # -----------------------------
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX], suppress_callback_exceptions=True)
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX], external_scripts=[static_assets.asset_url("js/main.js")],
+                suppress_callback_exceptions=True)
 app.title = "KenSAP"
 server = app.server  
-USERS_FILE = "data/users.json"
-
-# Ensure users.json exists
-os.makedirs("data", exist_ok=True)
-if not os.path.exists(USERS_FILE):
-    with open(USERS_FILE, "w") as f:
-        json.dump({}, f)
 
 # -----------------------------
 # Page layouts
@@ -62,7 +62,16 @@ app.layout = html.Div([
     ),
     
     dcc.Location(id='url', refresh=False),
+
+    # Pages ship with the initial layout and are shown or hidden in the
+    # browser (alumni and profile are shells their own callbacks fill in);
+    # only the gallery layout comes from the server, into page-content.
+    html.Div(login_layout, id='page-login', style={'display': 'none'}),
+    html.Div(homepage.layout(), id='page-home', style={'display': 'none'}),
+    html.Div(alumni.layout(), id='page-alumni', style={'display': 'none'}),
+    html.Div(profile.layout(), id='page-profile', style={'display': 'none'}),
     html.Div(id='page-content'),
+    dcc.Store(id='page-request'),
 
     html.Footer([
         html.Hr(),
@@ -86,45 +95,66 @@ gallery.register_callbacks(app)
 profile.register_callbacks(app)
 alumni.register_callbacks(app)
 
+# Flask routes served next to the Dash app
+static_assets.register_routes(server)
+thumbnails.register_routes(server)
+alumni.register_routes(server)
+uploads.register_routes(server)
+
 # -----------------------------
 # Page routing
 # -----------------------------
+# Routing, login gating and logout run in the browser (static/js/main.js);
+# they set page-request only when a page needs its layout from the server.
+app.clientside_callback(
+    ClientsideFunction(namespace="kensap", function_name="route"),
+    Output('page-login', 'style'),
+    Output('page-home', 'style'),
+    Output('page-alumni', 'style'),
+    Output('page-profile', 'style'),
+    Output('page-content', 'style'),
+    Output('page-request', 'data'),
+    Input('url', 'pathname'),
+    Input('user-session', 'data')
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="kensap", function_name="logout"),
+    Output('user-session', 'data', allow_duplicate=True),
+    Output('login-output', 'children', allow_duplicate=True),
+    Output('url', 'pathname', allow_duplicate=True),
+    Input('url', 'pathname'),
+    prevent_initial_call='initial_duplicate'
+)
+
+def page_layout(pathname):
+    # The gallery comes from the per-process page cache and is rebuilt only
+    # when static/photos changes.
+    if pathname == '/gallery':
+        return pages.get("gallery", gallery.layout, version=gallery.photos_version())
+    return None
+
 @app.callback(
     Output('page-content', 'children'),
-    Input('url', 'pathname'),
-    State('user-session', 'data')
+    Input('page-request', 'data'),
+    State('user-session', 'data'),
+    prevent_initial_call=True
 )
-def display_page(pathname, session_data):
-    # Redirect / to homepage if logged in
-    if pathname == '/':
-        if session_data:
-            return homepage.layout(session_data)
-        else:
-            return login_layout
+def display_page(page_request, session_data):
+    pathname = (page_request or {}).get('path')
 
     # Restrict pages unless logged in
-    if pathname not in ['/login', '/homepage'] and not session_data:
-        return login_layout
-
-    # Page routing
-    if pathname == '/login':
-        return login_layout
-    elif pathname == '/homepage':
-        return homepage.layout(session_data)
-    elif pathname == '/gallery':
-        return gallery.layout()
-    elif pathname == '/alumni':
-        return alumni.layout()
-    elif pathname == '/profile':
-        return profile.layout(session_data)
-    elif pathname == '/logout':
-        return html.Div("You have logged out")
-    else:
-        return login_layout
+    if not session_data:
+        return None
+
+    layout = page_layout(pathname)
+    if layout is None:
+        raise dash.exceptions.PreventUpdate
+    return layout
 
 
 # -----------------------------
-# Combined Authentication + Logout callback
+# Authentication
 # -----------------------------
 @app.callback(
     Output("user-session", "data"),
@@ -132,24 +162,17 @@ def display_page(pathname, session_data):
     Output("url", "pathname"),  # Redirect after login
     Input("login-button", "n_clicks"),
     Input("signup-button", "n_clicks"),
-    Input("url", "pathname"),
     State("username", "value"),
     State("password", "value"),
     State("user-session", "data"),
     prevent_initial_call=True
 )
-def handle_auth_and_logout(login_click, signup_click, pathname, username, password, session_data):
+def handle_auth(login_click, signup_click, username, password, session_data):
     ctx = callback_context
     if not ctx.triggered:
         raise dash.exceptions.PreventUpdate
     trigger = ctx.triggered[0]['prop_id'].split('.')[0]
 
-    # -------------------------
-    # LOGOUT
-    # -------------------------
-    if pathname == "/logout":
-        return None, "You have logged out.", "/login"
-
     # -------------------------
     # LOGIN / SIGNUP
     # -------------------------
@@ -159,28 +182,28 @@ def handle_auth_and_logout(login_click, signup_click, pathname, username, passwo
     if not username or not password:
         return session_data, "Please enter both username and password.", dash.no_update
 
-    with open(USERS_FILE, "r") as f:
-        users = json.load(f)
-
     if trigger == "login-button":
-        if username in users and users[username] == password:
-            return {"username": username}, f"Login successful. Welcome {username}!", "/homepage"
+        if user_store.check_login(username, password):
+            session = {"username": username, "upload_token": uploads.issue_token(username)}
+            return session, f"Login successful. Welcome {username}!", "/homepage"
         else:
             return None, "Invalid username or password.", dash.no_update
 
     if trigger == "signup-button":
-        if username in users:
-            return session_data, "Username already exists. Try logging in.", dash.no_update
-        else:
-            users[username] = password
-            with open(USERS_FILE, "w") as f:
-                json.dump(users, f)
+        if user_store.create_user(username, password):
             return session_data, f"Sign-up successful! You can now log in, {username}.", dash.no_update
+        else:
+            return session_data, "Username already exists. Try logging in.", dash.no_update
+
+# Callback timing and payload sizes, exported at /metrics
+metrics.instrument(app)
+warmup.instrument(server)
 
 # -----------------------------
 # Run the app
 # -----------------------------
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8050))
-    app.run_server(debug=False, host="0.0.0.0", port=port)
+    warmup.run(server, page_layout)
+    app.run(debug=False, host="0.0.0.0", port=port)
 
@@ -0,0 +1,401 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------------
+# Load benchmark for the Dash callback endpoints
+# -----------------------------
+# Drives scripted user sessions (sign-up, login, page routing, gallery
+# paging and comments, alumni updates, profile saves) through
+# /_dash-update-component and reports throughput, latency percentiles and
+# request/response bytes per callback. Meanwhile open alumni tabs (more
+# than the server has event streams for) hold streams or, refused one,
+# poll /alumni/changes the way main.js does.
+#
+#   python benchmark.py --sessions 50 --concurrency 8 --output run.json
+#   python benchmark.py --compare baseline.json --output run.json
+#   python benchmark.py --url http://127.0.0.1:8000   # a running gunicorn
+#
+# In-process runs work on a throwaway copy of data/ and users/; --url
+# runs write to whatever data directory that server uses.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# callback label -> its outputs (allow_duplicate hashes stripped)
+CALLBACKS = {
+    "handle_auth": "..user-session.data...login-output.children...url.pathname..",
+    "display_page": "page-content.children",
+    "load_more_photos": "..gallery-photos.children...gallery-cursor.data...gallery-load-more.style..",
+    "handle_comments": '..{"index":["MATCH"],"type":"comments"}.children...{"index":["MATCH"],"type":"comments-cursor"}.data'
+                       '...{"index":["MATCH"],"type":"comments-more"}.style...{"index":["MATCH"],"type":"input"}.value'
+                       '...{"index":["MATCH"],"type":"status"}.children..',
+    "load_older_comments": '..{"index":["MATCH"],"type":"comments"}.children...{"index":["MATCH"],"type":"comments-cursor"}.data'
+                           '...{"index":["MATCH"],"type":"comments-more"}.style..',
+    "display_alumni": "..alumni-list.children...alumni-empty.children...alumni-empty.style...alumni-version.data"
+                      "...alumni-cursor.data...alumni-more.style..",
+    "add_alumni": "..alumni-output.children...alumni-name-input.value..",
+    "display_profile": "..profile-display.children...profile-cursor.data...profile-load-older.style..",
+    "save_profile": "..profile-output.children...profile-input.value..",
+}
+
+# -----------------------------
+# Transports
+# -----------------------------
+class InProcessClient:
+    """Calls app.server through Flask's test client."""
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def get(self, path):
+        r = self.client.get(path)
+        return r.status_code, r.data
+
+    def post(self, path, body):
+        r = self.client.post(path, data=body, content_type="application/json")
+        return r.status_code, r.data
+
+class HttpClient:
+    """Calls a running server over HTTP."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def _send(self, req):
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, body):
+        return self._send(urllib.request.Request(
+            self.base_url + path, data=body, headers={"Content-Type": "application/json"}))
+
+def start_in_process():
+    """Import the app inside a scratch copy of the data folders."""
+    workdir = tempfile.mkdtemp(prefix="kensap-bench-")
+    for folder in ("data", "users"):
+        shutil.copytree(os.path.join(REPO_DIR, folder), os.path.join(workdir, folder),
+                        ignore=shutil.ignore_patterns("*.db", "*.db-wal", "*.db-shm"))
+    os.symlink(os.path.join(REPO_DIR, "static"), os.path.join(workdir, "static"))
+    os.chdir(workdir)
+    # Its metrics stay in the scratch copy too, never in a server's METRICS_DIR.
+    os.environ["METRICS_DIR"] = os.path.join(workdir, "metrics")
+    sys.path.insert(0, REPO_DIR)
+    import app
+    return app.server, workdir
+
+# -----------------------------
+# Callback requests
+# -----------------------------
+def strip_hash(output):
+    return re.sub(r"@[0-9a-f]+", "", output)
+
+def parse_outputs(output):
+    parts = output[2:-2].split("...") if output.startswith("..") else [output]
+    outputs = []
+    for part in parts:
+        component_id, prop = part.rsplit(".", 1)
+        outputs.append((component_id, prop))
+    return outputs
+
+def short_name(component_id):
+    """'alumni-list' for plain ids, the 'type' for pattern-matching ones."""
+    return json.loads(component_id)["type"] if component_id.startswith("{") else component_id
+
+def concrete_id(component_id, index):
+    """Turn a pattern-matching id string into the dict for one component."""
+    if not component_id.startswith("{"):
+        return component_id
+    parsed = json.loads(component_id)
+    return {k: (index if v == ["MATCH"] else v) for k, v in parsed.items()}
+
+def prop_id(component_id, prop):
+    if isinstance(component_id, dict):
+        component_id = json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+    return f"{component_id}.{prop}"
+
+class Callbacks:
+    def __init__(self, client):
+        status, body = client.get("/_dash-dependencies")
+        if status != 200:
+            raise RuntimeError(f"/_dash-dependencies returned {status}")
+        by_output = {strip_hash(d["output"]): d for d in json.loads(body)}
+        self.deps = {}
+        for label, output in CALLBACKS.items():
+            if output not in by_output:
+                raise RuntimeError(f"callback {label} ({output}) is not registered")
+            self.deps[label] = by_output[output]
+
+    def body(self, label, values, changed, index=None):
+        """Request body for `label`.
+
+        `values` and `changed` use 'name.prop' keys, where name is the
+        component id, or the 'type' of a pattern-matching id (whose index is
+        then `index`).
+        """
+        dep = self.deps[label]
+        ids = {}
+
+        def fill(specs):
+            filled = []
+            for spec in specs:
+                name = short_name(spec["id"])
+                ids[name] = concrete_id(spec["id"], index)
+                filled.append({"id": ids[name], "property": spec["property"],
+                               "value": values.get(f"{name}.{spec['property']}")})
+            return filled
+
+        inputs, state = fill(dep["inputs"]), fill(dep["state"])
+        outputs = [{"id": concrete_id(i, index), "property": p}
+                   for i, p in parse_outputs(strip_hash(dep["output"]))]
+        return json.dumps({
+            "output": dep["output"],
+            "outputs": outputs if dep["output"].startswith("..") else outputs[0],
+            "inputs": inputs,
+            "state": state,
+            "changedPropIds": [prop_id(ids[c.rsplit(".", 1)[0]], c.rsplit(".", 1)[1]) for c in changed],
+        }).encode("utf-8")
+
+# -----------------------------
+# Recording
+# -----------------------------
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # label -> list of (seconds, request bytes, response bytes, ok)
+        self.lock = threading.Lock()
+
+    def add(self, label, seconds, request_bytes, response_bytes, ok):
+        with self.lock:
+            self.samples.setdefault(label, []).append((seconds, request_bytes, response_bytes, ok))
+
+    def call(self, client, callbacks, label, values, changed, index=None):
+        body = callbacks.body(label, values, changed, index)
+        started = time.perf_counter()
+        status, response = client.post("/_dash-update-component", body)
+        self.add(label, time.perf_counter() - started, len(body), len(response), status in (200, 204))
+        return json.loads(response) if status == 200 else None
+
+def find_prop(tree, component_id, prop):
+    """Look up a prop of the component with this id in a callback response."""
+    if isinstance(tree, dict):
+        if tree.get("props", {}).get("id") == component_id:
+            return tree["props"].get(prop)
+        values = tree.values()
+    elif isinstance(tree, list):
+        values = tree
+    else:
+        return None
+    for value in values:
+        found = find_prop(value, component_id, prop)
+        if found is not None:
+            return found
+    return None
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+def summarize(recorder, wall_seconds):
+    report = {}
+    total = 0
+    for label, samples in sorted(recorder.samples.items()):
+        latencies = sorted(s[0] * 1000 for s in samples)
+        total += len(samples)
+        report[label] = {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if not s[3]),
+            "throughput_rps": round(len(samples) / wall_seconds, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_request_bytes": round(sum(s[1] for s in samples) / len(samples)),
+            "mean_response_bytes": round(sum(s[2] for s in samples) / len(samples)),
+        }
+    return report, total
+
+# -----------------------------
+# Scripted session
+# -----------------------------
+def run_session(n, client, callbacks, recorder, photos):
+    call = lambda label, values, changed, index=None: recorder.call(client, callbacks, label, values, changed, index)
+    username = f"bench-{os.getpid()}-{n}-{random.randrange(1 << 30)}"
+    password = "bench-password"
+    session = {"username": username}
+    credentials = {"username.value": username, "password.value": password, "user-session.data": None}
+
+    call("handle_auth", dict(credentials, **{"signup-button.n_clicks": 1}), ["signup-button.n_clicks"])
+    call("handle_auth", dict(credentials, **{"login-button.n_clicks": 1}), ["login-button.n_clicks"])
+
+    # Gallery: first page, one more page, a comment and a refresh.
+    page = call("display_page", {"page-request.data": {"path": "/gallery"}, "user-session.data": session},
+                ["page-request.data"])
+    call("load_more_photos", {"gallery-load-more.n_clicks": 1,
+                              "gallery-cursor.data": find_prop(page, "gallery-cursor", "data")},
+         ["gallery-load-more.n_clicks"])
+    if photos:
+        photo = random.choice(photos[:12])
+        comment = {"submit.n_clicks": 1, "show.n_clicks": 1, "input.value": f"comment from {username}",
+                   "user-session.data": session}
+        call("handle_comments", comment, ["submit.n_clicks"], index=photo)
+        shown = call("handle_comments", comment, ["show.n_clicks"], index=photo)
+        cursor = next((v["data"] for k, v in (shown or {}).get("response", {}).items()
+                       if '"comments-cursor"' in k), None)
+        if cursor:
+            call("load_older_comments", {"comments-more.n_clicks": 1, "comments-cursor.data": cursor},
+                 ["comments-more.n_clicks"], index=photo)
+
+    # Alumni (shipped with the initial layout): first render, a sign-up
+    # (pushed deltas are applied in the browser), a search.
+    call("display_alumni", {"alumni-refresh.data": 1}, ["alumni-refresh.data"])
+    call("add_alumni", {"add-alumni-button.n_clicks": 1, "alumni-name-input.value": username},
+         ["add-alumni-button.n_clicks"])
+    call("display_alumni", {"alumni-search.value": username[:8]}, ["alumni-search.value"])
+
+    # Profile (shipped with the initial layout): render and save.
+    call("display_profile", {"user-session.data": session}, [])
+    call("save_profile", {"save-profile-button.n_clicks": 1, "profile-input.value": "benchmark entry",
+                          "user-session.data": session}, ["save-profile-button.n_clicks"])
+
+# -----------------------------
+# Open alumni tabs
+# -----------------------------
+TAB_POLL_SECONDS = 1.0  # main.js waits about 5s; shorter here to load the server
+TAB_POLLS_PER_STREAM = 6
+
+def run_alumni_tab(client, recorder, stop):
+    """Hold an event stream while one is free; refused, poll for changes."""
+    version = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        status, body = client.get(f"/alumni/events?since={version}")
+        if status == 503:
+            recorder.add("alumni_stream_refused", time.perf_counter() - started, 0, len(body), True)
+        elif status == 200:
+            # The stream ran its course; carry on from its last delta.
+            for line in body.decode("utf-8").splitlines():
+                if line.startswith("data: ") and '"version"' in line:
+                    version = json.loads(line[6:])["version"]
+            continue
+        for _ in range(TAB_POLLS_PER_STREAM):
+            if stop.wait(TAB_POLL_SECONDS):
+                return
+            started = time.perf_counter()
+            status, body = client.get(f"/alumni/changes?since={version}")
+            recorder.add("alumni_changes", time.perf_counter() - started, 0, len(body), status in (200, 204))
+            if status == 200:
+                version = json.loads(body)["version"]
+
+# -----------------------------
+# Comparison
+# -----------------------------
+def compare(current, baseline, max_regression):
+    """Print p95/throughput changes; return True if any p95 regressed too far."""
+    regressed = False
+    print(f"\n{'callback':<20}{'p95 base':>10}{'p95 now':>10}{'change':>9}")
+    for label, now in current["callbacks"].items():
+        base = baseline.get("callbacks", {}).get(label)
+        if not base:
+            continue
+        change = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+        flag = ""
+        if change > max_regression:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{label:<20}{base['p95_ms']:>10.2f}{now['p95_ms']:>10.2f}{change:>8.1f}%{flag}")
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the KenSAP Dash callbacks.")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--sessions", type=int, default=20, help="number of scripted user sessions")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions run at the same time")
+    parser.add_argument("--warmup", type=int, default=1, help="sessions run before measuring")
+    parser.add_argument("--alumni-tabs", type=int, default=8,
+                        help="alumni pages kept open during the run (more than the server streams to)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="p95 increase (percent) that makes --compare fail")
+    args = parser.parse_args(argv)
+
+    workdir = None
+    cwd = os.getcwd()  # --output and --compare are relative to it
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        server, workdir = start_in_process()
+        make_client = lambda: InProcessClient(server)
+
+    try:
+        callbacks = Callbacks(make_client())
+        photos = sorted(f for f in os.listdir(os.path.join(REPO_DIR, "static", "photos"))
+                        if f.lower().endswith((".png", ".jpg", ".jpeg", ".gif")))
+
+        for n in range(args.warmup):
+            run_session(-1 - n, make_client(), callbacks, Recorder(), photos)
+
+        recorder = Recorder()
+        stop = threading.Event()
+        for _ in range(args.alumni_tabs):
+            # Daemons: a tab may be inside a 25s stream when the run ends.
+            threading.Thread(target=run_alumni_tab, args=(make_client(), recorder, stop), daemon=True).start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_session, n, make_client(), callbacks, recorder, photos)
+                       for n in range(args.sessions)]
+            for future in futures:
+                future.result()
+        wall = time.perf_counter() - started
+        stop.set()
+    finally:
+        if workdir:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report, total = summarize(recorder, wall)
+    results = {
+        "meta": {
+            "target": args.url or "in-process",
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "wall_seconds": round(wall, 3),
+        },
+        "total": {"requests": total, "throughput_rps": round(total / wall, 2)},
+        "callbacks": report,
+    }
+
+    print(f"{'callback':<20}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req B':>8}{'resp B':>9}")
+    for label, r in report.items():
+        print(f"{label:<20}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['mean_request_bytes']:>8}{r['mean_response_bytes']:>9}")
+    print(f"\n{total} requests in {wall:.2f}s ({total / wall:.1f} req/s)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+
+import alumni_store
+import datastore
+import comments_store
+import user_store
+import profile_store
+
+# -----------------------------
+# Bulk import and export
+# -----------------------------
+# Streams records in and out of the data stores without loading a whole
+# file or table into memory:
+#
+#   python bulk.py import alumni roster.csv          # CSV needs a header row
+#   python bulk.py import comments archive.jsonl --batch 1000 --pause 0.1
+#   python bulk.py export users users-backup.jsonl   # or "-" for stdout
+#
+# Imports apply the same rules as the site (blank names or comments are
+# rejected, names are unique case-insensitively, usernames are unique) and
+# write each batch in one transaction, so the site keeps serving while a
+# large file loads. Re-running an import skips what is already there.
+DATASETS = ("alumni", "comments", "users", "profiles")
+BATCH_SIZE = 500
+
+# -----------------------------
+# Reading input
+# -----------------------------
+def read_records(path, fmt=None):
+    """Yield one dict per CSV row or JSONL line (None for a line that isn't JSON)."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    f = sys.stdin if path == "-" else open(path, "r", newline="", encoding="utf-8-sig")
+    try:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else None
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def text(record, field):
+    value = record.get(field)
+    return value.strip() if isinstance(value, str) else ""
+
+# -----------------------------
+# Validation (same rules as the site)
+# -----------------------------
+def valid_alumni(record):
+    name = text(record, "name")
+    return name or None
+
+def valid_user(record):
+    username = record.get("username")
+    if not isinstance(username, str) or not username:
+        return None
+    password_hash = record.get("password_hash")
+    if password_hash:
+        return (username, password_hash) if user_store.is_password_hash(password_hash) else None
+    password = record.get("password")
+    if not isinstance(password, str) or not password:
+        return None
+    return username, password
+
+def valid_comment(record):
+    photo, body = text(record, "photo"), text(record, "text")
+    if not photo or not body or os.path.basename(photo) != photo:
+        return None
+    username = text(record, "username") or "Unknown User"  # as profile.get_current_username
+    timestamp = text(record, "timestamp") or (datetime.utcnow() + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")
+    return photo, username, timestamp, body
+
+def valid_profile(record):
+    username, body = text(record, "username"), text(record, "text")
+    if not username or not body or os.path.basename(username) != username or username.startswith("."):
+        return None
+    saved_at = text(record, "saved_at") or datetime.utcnow().isoformat(timespec="seconds")
+    return username, body, saved_at
+
+# -----------------------------
+# Writing one batch; each returns the number of records added
+# -----------------------------
+def import_alumni(batch):
+    return len(alumni_store.add_names(batch))
+
+def import_users(batch):
+    rows = [(u, p if user_store.is_password_hash(p) else user_store.hash_password(p)) for u, p in batch]
+    return len(user_store.import_users(rows))
+
+def import_comments(batch):
+    rows, seen = [], set()
+    for row in batch:
+        if row in seen or comments_store.comment_exists(*row):
+            continue
+        seen.add(row)
+        rows.append(row)
+    if rows:
+        comments_store.add_comments(rows)
+    return len(rows)
+
+def existing_profile_entries(username):
+    profile_store.migrate_legacy_profile(username)
+    entries = set()
+    try:
+        with open(profile_store.get_log_path(username), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries.add((entry.get("text"), entry.get("saved_at")))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+def import_profiles(batch):
+    by_user = {}
+    for username, body, saved_at in batch:
+        by_user.setdefault(username, []).append((body, saved_at))
+    added = 0
+    for username, entries in by_user.items():
+        existing = existing_profile_entries(username)
+        new = []
+        for entry in entries:
+            if entry not in existing:
+                existing.add(entry)
+                new.append(entry)
+        if new:
+            profile_store.append_entries(username, new)
+            added += len(new)
+    return added
+
+IMPORTERS = {
+    "alumni": (valid_alumni, import_alumni),
+    "comments": (valid_comment, import_comments),
+    "users": (valid_user, import_users),
+    "profiles": (valid_profile, import_profiles),
+}
+
+# -----------------------------
+# Export
+# -----------------------------
+def export_alumni():
+    alumni_store.refresh()  # creates the log from data/alumni.json if needed
+    seen = set()
+    with open(alumni_store.ALUMNI_LOG, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                folded = alumni_store.fold(record["name"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            if folded and folded not in seen:
+                seen.add(folded)
+                yield record
+
+def export_comments():
+    for c in comments_store.iter_comments():
+        yield {"photo": c["photo"], "username": c["username"], "timestamp": c["timestamp"], "text": c["text"]}
+
+def export_users():
+    for username, password_hash in user_store.iter_users():
+        yield {"username": username, "password_hash": password_hash}
+
+def export_profiles():
+    # Log files are named after the username with spaces as underscores.
+    names = sorted({os.path.splitext(n)[0] for n in os.listdir(profile_store.USERS_FOLDER)
+                    if n.endswith((".json", ".jsonl"))})
+    for username in names:
+        profile_store.migrate_legacy_profile(username)
+        try:
+            with open(profile_store.get_log_path(username), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    yield {"username": username, "text": entry.get("text"), "saved_at": entry.get("saved_at")}
+        except FileNotFoundError:
+            continue
+
+EXPORTERS = {
+    "alumni": export_alumni,
+    "comments": export_comments,
+    "users": export_users,
+    "profiles": export_profiles,
+}
+
+# -----------------------------
+# Progress
+# -----------------------------
+class Progress:
+    def __init__(self, dataset, counters=("read", "added", "skipped", "invalid")):
+        self.dataset = dataset
+        self.counts = dict.fromkeys(counters, 0)
+        self.started = time.monotonic()
+
+    def report(self, final=False):
+        elapsed = time.monotonic() - self.started
+        rate = next(iter(self.counts.values())) / elapsed if elapsed else 0.0
+        summary = ", ".join(f"{v} {k}" for k, v in self.counts.items())
+        print(f"[{self.dataset}] {summary} ({rate:.0f}/s){' done' if final else ''}", file=sys.stderr)
+
+def run_import(dataset, path, fmt=None, batch_size=BATCH_SIZE, pause=0.0):
+    validate, write = IMPORTERS[dataset]
+    progress = Progress(dataset)
+
+    def valid_records():
+        for record in read_records(path, fmt):
+            progress.counts["read"] += 1
+            value = validate(record) if record is not None else None
+            if value is None:
+                progress.counts["invalid"] += 1
+                continue
+            yield value
+
+    for batch in batches(valid_records(), batch_size):
+        added = write(batch)
+        progress.counts["added"] += added
+        progress.counts["skipped"] += len(batch) - added
+        progress.report()
+        if pause:
+            time.sleep(pause)  # leave room for the site's own writes
+    progress.report(final=True)
+    return progress.counts
+
+def run_export(dataset, path):
+    """Write the dataset as JSONL; a file only appears once it is complete."""
+    progress = Progress(dataset, ("written",))
+    with contextlib.nullcontext(sys.stdout) if path == "-" else datastore.atomic_write(path) as out:
+        for record in EXPORTERS[dataset]():
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            progress.counts["written"] += 1
+            if progress.counts["written"] % 10000 == 0:
+                progress.report()
+    progress.report(final=True)
+    return progress.counts
+
+# -----------------------------
+# Command line
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import and export of KenSAP data.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("path", help='file to read or write ("-" for stdin/stdout)')
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="records per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to wait between batches")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        run_import(args.dataset, args.path, args.format, args.batch, args.pause)
+    else:
+        run_export(args.dataset, args.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sqlite3
+import threading
+
+import sqlite_store
+from metrics import timed
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# Comments live in SQLite (WAL mode): a new comment is a single indexed
+# append instead of a rewrite of every comment ever posted, and SQLite's
+# file locking keeps concurrent gunicorn workers from losing writes.
+COMMENTS_DB = "data/comments.db"
+LEGACY_COMMENTS_FILE = "data/comments.json"
+
+# Truncate the write-ahead log after this many commits so it stays small.
+CHECKPOINT_EVERY = 200
+
+os.makedirs("data", exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    photo TEXT NOT NULL,
+    username TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_by_photo ON comments (photo, id);
+"""
+
+# -----------------------------
+# Connections
+# -----------------------------
+_db = sqlite_store.Database(COMMENTS_DB, SCHEMA, row_factory=sqlite3.Row)
+connect = _db.connect
+close = _db.close
+
+def init_store():
+    _db.init()
+    _db.run_once("legacy_json_migrated", migrate_legacy_json)
+
+def migrate_legacy_json(conn):
+    """Import data/comments.json ({photo: [newest first]})."""
+    legacy = sqlite_store.load_legacy_json(LEGACY_COMMENTS_FILE)
+    rows = []
+    if isinstance(legacy, dict):
+        for photo, entries in legacy.items():
+            # Oldest first, so ids follow posting order.
+            for c in reversed(entries or []):
+                rows.append((photo, c.get("username", ""), c.get("timestamp", ""), c.get("text", "")))
+    conn.executemany(
+        "INSERT INTO comments (photo, username, timestamp, text) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+# -----------------------------
+# Reads
+# -----------------------------
+@timed("comments", "read")
+def get_comments(photo, before=None, limit=None):
+    """Return one photo's comments, newest first.
+
+    `before` is a comment id (the cursor of the previous page); only older
+    comments are returned, at most `limit` of them.
+    """
+    query = "SELECT id, username, timestamp, text FROM comments WHERE photo = ?"
+    params = [photo]
+    if before is not None:
+        query += " AND id < ?"
+        params.append(before)
+    query += " ORDER BY id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return [dict(r) for r in connect().execute(query, params).fetchall()]
+
+@timed("comments", "read")
+def latest_id(photo):
+    """Id of the photo's newest comment (0 if none); changes on every new comment."""
+    row = connect().execute("SELECT MAX(id) FROM comments WHERE photo = ?", (photo,)).fetchone()
+    return row[0] or 0
+
+def iter_comments(batch=1000):
+    """Yield every comment, oldest first, reading `batch` rows per query.
+
+    Each page is its own short read, so a long export never pins an old
+    snapshot of the write-ahead log.
+    """
+    last = 0
+    while True:
+        rows = connect().execute(
+            "SELECT id, photo, username, timestamp, text FROM comments WHERE id > ? ORDER BY id LIMIT ?",
+            (last, batch)
+        ).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield dict(r)
+        last = rows[-1]["id"]
+
+def comment_exists(photo, username, timestamp, text):
+    row = connect().execute(
+        "SELECT 1 FROM comments WHERE photo = ? AND username = ? AND timestamp = ? AND text = ? LIMIT 1",
+        (photo, username, timestamp, text)
+    ).fetchone()
+    return row is not None
+
+# -----------------------------
+# Writes (group commit)
+# -----------------------------
+# Threads that arrive while a commit is in flight queue their rows; the next
+# thread to take the flush lock commits the whole queue in one transaction,
+# so a burst of comments costs one fsync instead of one each.
+_pending = []
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_commits = 0
+
+class _PendingWrite:
+    def __init__(self, row):
+        self.row = row
+        self.id = None
+        self.error = None
+        self.done = False
+
+def _flush():
+    global _commits
+    with _pending_lock:
+        batch = _pending[:]
+        del _pending[:]
+    if not batch:
+        return
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for item in batch:
+            item.id = conn.execute(
+                "INSERT INTO comments (photo, username, timestamp, text) VALUES (?, ?, ?, ?)",
+                item.row
+            ).lastrowid
+        conn.execute("COMMIT")
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        for item in batch:
+            item.error = e
+    for item in batch:
+        item.done = True
+
+    _commits += 1
+    if _commits % CHECKPOINT_EVERY == 0:
+        compact()
+
+@timed("comments", "write")
+def add_comments(rows):
+    """Append (photo, username, timestamp, text) rows; return their ids.
+
+    Raises if the write failed, so callers can tell the user.
+    """
+    items = [_PendingWrite(tuple(row)) for row in rows]
+    with _pending_lock:
+        _pending.extend(items)
+    with _flush_lock:
+        if not all(item.done for item in items):
+            _flush()
+    for item in items:
+        if item.error is not None:
+            raise item.error
+    return [item.id for item in items]
+
+def add_comment(photo, username, timestamp, text):
+    return add_comments([(photo, username, timestamp, text)])[0]
+
+def compact():
+    """Fold the write-ahead log back into the database and truncate it."""
+    connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+init_store()
@@ -0,0 +1,125 @@
+import os
+import json
+import threading
+import contextlib
+from collections import OrderedDict
+
+# -----------------------------
+# Settings
+# -----------------------------
+# Read-through cache for JSON files that are read far more often than they
+# change. Entries are keyed on path and checked against the file's mtime,
+# size and inode on every read, so a write by any worker (always a rename,
+# see write_json_atomic) is seen by every other worker on its next read.
+DATASTORE_CACHE_MAX_BYTES = int(os.environ.get("DATASTORE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# -----------------------------
+# Cache
+# -----------------------------
+class JsonCache:
+    """LRU of parsed JSON files, bounded by the total size of the files on disk."""
+
+    def __init__(self, max_bytes=DATASTORE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # path -> (stamp, value, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def read(self, path, default=None):
+        """Return the parsed file, or `default` if it is missing or not JSON.
+
+        The value is shared with other callers: copy it before changing it.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return default
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            return default
+        except ValueError:
+            value = default
+
+        with self.lock:
+            self._drop(path)
+            if st.st_size <= self.max_bytes:
+                self.entries[path] = (stamp, value, st.st_size)
+                self.total_bytes += st.st_size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, dropped) = self.entries.popitem(last=False)
+                self.total_bytes -= dropped
+                self.evictions += 1
+        return value
+
+    def _drop(self, path):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.total_bytes -= old[2]
+
+    def invalidate(self, path):
+        with self.lock:
+            self._drop(path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+            }
+
+cache = JsonCache()
+
+# -----------------------------
+# Reads and writes
+# -----------------------------
+def read_json(path, default=None):
+    return cache.read(path, default)
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", replace=True):
+    """Yield a file open on a temporary name next to `path`, and move it into
+    place once the block finishes, so readers (in any worker) see either the
+    old file or the new one, never half of it.
+
+    With replace=False the file is linked into place instead, which raises
+    FileExistsError rather than replace a file another process made.
+    """
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode, encoding=None if "b" in mode else "utf-8") as f:
+            yield f
+        if replace:
+            os.replace(tmp, path)
+        else:
+            os.link(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        cache.invalidate(path)
+
+def write_json_atomic(path, data):
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False)
@@ -1,76 +1,181 @@
 import os
-import json
 import dash
-from dash import html, dcc, callback_context
+from dash import html, dcc, callback_context, Patch
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State, ALL
+from dash.dependencies import Input, Output, State, MATCH
 from datetime import datetime, timedelta
 from profile import get_current_username  # <-- fixed import
+import thumbnails
+import photo_index
+import static_assets
+import comments_store
+from layout_cache import LayoutCache
 
 # -----------------------------
 # Paths and files
 # -----------------------------
 PHOTOS_FOLDER = "static/photos"
-COMMENTS_FILE = "data/comments.json"
 
 os.makedirs(PHOTOS_FOLDER, exist_ok=True)
-os.makedirs("data", exist_ok=True)
-
-if not os.path.exists(COMMENTS_FILE):
-    with open(COMMENTS_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f, ensure_ascii=False)
-
-# -----------------------------
-# Helper functions
-# -----------------------------
-def safe_load_comments():
-    try:
-        with open(COMMENTS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                return data
-    except Exception:
-        pass
-    return {}
-
-def safe_save_comments(comments):
-    try:
-        with open(COMMENTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(comments, f, ensure_ascii=False)
-    except Exception:
-        pass
 
 # -----------------------------
 # Gallery layout
 # -----------------------------
-def layout():
-    photo_elements = []
-    for filename in os.listdir(PHOTOS_FOLDER):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            photo_elements.append(
-                html.Div([
-                    html.Img(src=f"/{PHOTOS_FOLDER}/{filename}", style={"width": "300px", "margin": "10px 0"}),
+# Only one page of photo cards is built and sent per request; the rest is
+# fetched through the "Load more" control (clicked automatically on scroll
+# by static/js/main.js when infinite scroll is enabled).
+GALLERY_PAGE_SIZE = int(os.environ.get("GALLERY_PAGE_SIZE", "12"))
+GALLERY_INFINITE_SCROLL = os.environ.get("GALLERY_INFINITE_SCROLL", "1") != "0"
+PHOTO_EXTENSIONS = photo_index.PHOTO_EXTENSIONS
+PHOTO_WIDTH = 300
+
+# Comment threads are sent COMMENTS_PAGE_SIZE at a time, newest first;
+# rendered pages are kept per process, up to COMMENT_CACHE_MAX_BYTES.
+COMMENTS_PAGE_SIZE = 10
+COMMENT_CACHE_MAX_BYTES = int(os.environ.get("COMMENT_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+comment_pages = LayoutCache(COMMENT_CACHE_MAX_BYTES)
+
+_listing = {"current": (None, [], {})}  # (version, [(sort key, filename)], index)
+
+def photos_version():
+    """Changes whenever a photo is added, removed or renamed, or the photo
+    index is updated."""
+    return os.stat(PHOTOS_FOLDER).st_mtime_ns, photo_index.index_stamp()
+
+def _current_listing():
+    """Photos newest first by capture date, with their index entries.
+
+    Indexing happens in the ingest worker (ingest.py), never on a request:
+    a photo it has not reached yet is listed with an empty entry and shown
+    without placeholder or dimensions.
+    """
+    version = photos_version()
+    listing = _listing["current"]
+    if listing[0] != version:
+        index = photo_index.load_index()
+        keyed = sorted(((photo_index.sort_key(f, index.get(f)), f)
+                        for f in os.listdir(PHOTOS_FOLDER) if f.lower().endswith(PHOTO_EXTENSIONS)),
+                       reverse=True)
+        listing = _listing["current"] = (version, keyed, index)
+    return listing
 
-                    html.Div(id={'type': 'comments', 'index': filename}),
+def list_photos():
+    """Return gallery photo filenames, newest first."""
+    return [f for _, f in _current_listing()[1]]
 
-                    dbc.Input(id={'type': 'input', 'index': filename},
-                              placeholder="Add a comment...", type="text"),
+def photo_info(filename):
+    """The photo's index entry (dimensions, placeholder...), or {} if unknown."""
+    return _current_listing()[2].get(filename) or {}
 
-                    dbc.Button("Submit", id={'type': 'submit', 'index': filename},
-                               color="primary", n_clicks=0, style={"marginTop": "5px"}),
+def photo_page(after=None, page_size=None):
+    """Return ([(sort key, filename)], has_more) for the page after cursor `after`.
 
-                    dbc.Button("Show Comments", id={'type': 'show', 'index': filename},
-                               color="secondary", n_clicks=0, style={"marginTop": "5px", "marginLeft": "5px"}),
+    The cursor is the sort key of the last card sent rather than an offset,
+    so photos added while someone is scrolling never produce a duplicate card.
+    """
+    page_size = page_size or GALLERY_PAGE_SIZE
+    photos = _current_listing()[1]
+    if after:
+        photos = [p for p in photos if p[0] < list(after)]
+    return photos[:page_size], len(photos) > page_size
 
-                    html.Div(id={'type': 'status', 'index': filename}, style={"marginTop": "5px"})
+def photo_image(filename):
+    """Responsive image: the browser picks the smallest derivative that fits
+    the 300px card; clicking it opens the original.
 
-                ], style={"border": "1px solid #ccc", "padding": "10px", "marginBottom": "20px"})
-            )
+    Indexed photos get their real width/height (so nothing jumps as images
+    arrive) and start out as the blurred placeholder; static/js/main.js
+    swaps in data-src/data-srcset once the card nears the viewport.
+    """
+    key = thumbnails.source_key(filename)
+    info = photo_info(filename)
+    webp = thumbnails.srcset(filename, "webp", key)
+    jpg = thumbnails.srcset(filename, "jpg", key)
+    src = thumbnails.derivative_url(filename, key, thumbnails.DERIVATIVE_WIDTHS[0], "jpg")
+    style = {"width": f"{PHOTO_WIDTH}px", "margin": "10px 0"}
+
+    if info.get("placeholder"):
+        size = {"width": PHOTO_WIDTH, "height": round(PHOTO_WIDTH * info["height"] / info["width"])}
+        style["height"] = "auto"
+        source = html.Source(type="image/webp", sizes=thumbnails.CARD_SIZES, **{"data-srcset": webp})
+        img = html.Img(src=info["placeholder"], sizes=thumbnails.CARD_SIZES, className="lazy-photo",
+                       style=style, **size, **{"data-src": src, "data-srcset": jpg})
+    else:
+        source = html.Source(type="image/webp", srcSet=webp, sizes=thumbnails.CARD_SIZES)
+        img = html.Img(src=src, srcSet=jpg, sizes=thumbnails.CARD_SIZES, style=style)
+
+    return html.A(
+        html.Picture([source, img]),
+        href=static_assets.asset_url(f"photos/{filename}"), target="_blank"
+    )
+
+def photo_card(filename):
+    return html.Div([
+        photo_image(filename),
+
+        html.Ul(id={'type': 'comments', 'index': filename}),
+        dbc.Button("Older comments", id={'type': 'comments-more', 'index': filename},
+                   color="link", n_clicks=0, style=more_comments_style(None)),
+        dcc.Store(id={'type': 'comments-cursor', 'index': filename}),
+
+        dbc.Input(id={'type': 'input', 'index': filename},
+                  placeholder="Add a comment...", type="text"),
+
+        dbc.Button("Submit", id={'type': 'submit', 'index': filename},
+                   color="primary", n_clicks=0, style={"marginTop": "5px"}),
+
+        dbc.Button("Show Comments", id={'type': 'show', 'index': filename},
+                   color="secondary", n_clicks=0, style={"marginTop": "5px", "marginLeft": "5px"}),
+
+        html.Div(id={'type': 'status', 'index': filename}, style={"marginTop": "5px"})
+
+    ], style={"border": "1px solid #ccc", "padding": "10px", "marginBottom": "20px"})
+
+def render_comments(photo_comments):
+    return [
+        html.Li([
+            html.B(f"{c['username']} – {c['timestamp']}"),
+            html.Br(),
+            html.Span(c['text'])
+        ]) for c in photo_comments
+    ]
+
+def comment_page(photo, before=None):
+    """Return (rendered comments, cursor for the next older page or None).
+
+    The newest page is cached until the photo gets a new comment; older
+    pages never change, since comments are only ever appended.
+    """
+    def build():
+        rows = comments_store.get_comments(photo, before=before, limit=COMMENTS_PAGE_SIZE + 1)
+        cursor = rows[COMMENTS_PAGE_SIZE - 1]["id"] if len(rows) > COMMENTS_PAGE_SIZE else None
+        return render_comments(rows[:COMMENTS_PAGE_SIZE]), cursor
+
+    if before is None:
+        return comment_pages.get(("newest", photo), build, version=comments_store.latest_id(photo))
+    return comment_pages.get(("older", photo, before), build)
+
+def more_comments_style(cursor):
+    return {"display": "inline-block" if cursor else "none", "padding": "0", "marginBottom": "5px"}
+
+def load_more_style(has_more):
+    return {"display": "block" if has_more else "none", "margin": "0 auto 30px auto"}
+
+def layout():
+    photos, has_more = photo_page()
 
     return html.Div([
         html.H2("Gallery", style={"textAlign": "center", "marginTop": "20px"}),
+        # static/js/main.js puts a file picker in here and streams the chosen
+        # photos to /uploads in chunks; they appear once the ingest worker is done.
+        html.Div(id="gallery-upload", style={"textAlign": "center", "marginBottom": "20px"}),
         dcc.Store(id="current-user", storage_type="session"),  # <-- REMOVE initial data, will use user-session from app.py
-        html.Div(photo_elements)
+        dcc.Store(id="gallery-cursor", data=photos[-1][0] if photos else None),
+        html.Div([photo_card(f) for _, f in photos], id="gallery-photos"),
+        dbc.Button("Load more photos", id="gallery-load-more", color="secondary", n_clicks=0,
+                   style=load_more_style(has_more),
+                   class_name="gallery-autoload" if GALLERY_INFINITE_SCROLL else "")
     ])
 
 # -----------------------------
@@ -78,69 +183,85 @@ def layout():
 # -----------------------------
 def register_callbacks(app):
     @app.callback(
-        Output({'type': 'comments', 'index': ALL}, 'children'),
-        Output({'type': 'input', 'index': ALL}, 'value'),
-        Output({'type': 'status', 'index': ALL}, 'children'),
-        Input({'type': 'submit', 'index': ALL}, 'n_clicks'),
-        Input({'type': 'show', 'index': ALL}, 'n_clicks'),
-        State({'type': 'input', 'index': ALL}, 'value'),
-        State({'type': 'comments', 'index': ALL}, 'id'),
+        Output("gallery-photos", "children"),
+        Output("gallery-cursor", "data"),
+        Output("gallery-load-more", "style"),
+        Input("gallery-load-more", "n_clicks"),
+        State("gallery-cursor", "data"),
+        prevent_initial_call=True
+    )
+    def load_more_photos(n_clicks, cursor):
+        photos, has_more = photo_page(after=cursor)
+        if not photos:
+            return dash.no_update, dash.no_update, load_more_style(False)
+
+        # Only the new cards travel over the wire; Patch appends them client-side.
+        cards = Patch()
+        cards.extend([photo_card(f) for _, f in photos])
+        return cards, photos[-1][0], load_more_style(has_more)
+
+    # MATCH scopes every request and response to the one photo that was
+    # clicked, and only one page of its thread is sent, so a click costs
+    # the same whatever the size of the gallery or the thread.
+    @app.callback(
+        Output({'type': 'comments', 'index': MATCH}, 'children'),
+        Output({'type': 'comments-cursor', 'index': MATCH}, 'data'),
+        Output({'type': 'comments-more', 'index': MATCH}, 'style'),
+        Output({'type': 'input', 'index': MATCH}, 'value'),
+        Output({'type': 'status', 'index': MATCH}, 'children'),
+        Input({'type': 'submit', 'index': MATCH}, 'n_clicks'),
+        Input({'type': 'show', 'index': MATCH}, 'n_clicks'),
+        State({'type': 'input', 'index': MATCH}, 'value'),
         State("user-session", "data"),  # <-- use global session from app.py
         prevent_initial_call=True
     )
-    def handle_comments(submit_n, show_n, input_values, comment_ids, user_session):
+    def handle_comments(submit_n, show_n, comment_text, user_session):
         ctx = callback_context
+        triggered_id = ctx.triggered_id
+        if not triggered_id:
+            raise dash.exceptions.PreventUpdate
+
         username = get_current_username(user_session)  # <-- still works
-        comments = safe_load_comments()
-        status_messages = [""] * len(input_values)
-        ...
+        photo_name = triggered_id['index']
+        input_value = dash.no_update
+        status = ""
 
+        if triggered_id['type'] == 'submit':
+            try:
+                if comment_text and comment_text.strip():
+                    comments_store.add_comment(
+                        photo_name,
+                        username,
+                        (datetime.utcnow() + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M"),  # <-- fixed time
+                        comment_text.strip()
+                    )
+                    input_value = ""
+                    status = dbc.Alert("Comment uploaded!", color="success")
+                else:
+                    status = dbc.Alert("Cannot submit empty comment.", color="warning")
+            except Exception:
+                status = dbc.Alert("Failed to upload comment.", color="danger")
 
-        triggered_id = ctx.triggered_id
+        elif triggered_id['type'] == 'show':
+            status = dbc.Alert("Comments refreshed.", color="info")
 
-        if triggered_id:
-            photo_name = triggered_id['index']
-            input_indices = [comp['id']['index'] for comp in ctx.inputs_list[0]]
-            input_index = input_indices.index(photo_name)
-
-            if triggered_id['type'] == 'submit':
-                comment_text = input_values[input_index]
-                try:
-                    if comment_text and comment_text.strip():
-                        comment_entry = {
-                            "username": username,
-                            "timestamp": (datetime.utcnow() + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M"),  # <-- fixed time
-                            "text": comment_text.strip()
-                        }
-                        if photo_name not in comments:
-                            comments[photo_name] = []
-                        comments[photo_name].insert(0, comment_entry)
-                        safe_save_comments(comments)
-                        input_values[input_index] = ""
-                        status_messages[input_index] = dbc.Alert("Comment uploaded!", color="success")
-                    else:
-                        status_messages[input_index] = dbc.Alert("Cannot submit empty comment.", color="warning")
-                except Exception:
-                    status_messages[input_index] = dbc.Alert("Failed to upload comment.", color="danger")
-
-            elif triggered_id['type'] == 'show':
-                status_messages[input_index] = dbc.Alert("Comments refreshed.", color="info")
-
-        all_comments = []
-        for c_id in comment_ids:
-            filename = c_id['index']
-            photo_comments = comments.get(filename, [])
-            if photo_comments:
-                formatted = [
-                    html.Li([
-                        html.B(f"{c['username']} – {c['timestamp']}"),
-                        html.Br(),
-                        html.Span(c['text'])
-                    ]) for c in photo_comments
-                ]
-                all_comments.append(html.Ul(formatted))
-            else:
-                all_comments.append(html.P("No comments yet."))
-
-        return all_comments, input_values, status_messages
+        items, cursor = comment_page(photo_name)
+        if not items:
+            items = [html.Li("No comments yet.", style={"listStyle": "none"})]
+        return items, cursor, more_comments_style(cursor), input_value, status
 
+    @app.callback(
+        Output({'type': 'comments', 'index': MATCH}, 'children', allow_duplicate=True),
+        Output({'type': 'comments-cursor', 'index': MATCH}, 'data', allow_duplicate=True),
+        Output({'type': 'comments-more', 'index': MATCH}, 'style', allow_duplicate=True),
+        Input({'type': 'comments-more', 'index': MATCH}, 'n_clicks'),
+        State({'type': 'comments-cursor', 'index': MATCH}, 'data'),
+        prevent_initial_call=True
+    )
+    def load_older_comments(n_clicks, cursor):
+        if not cursor:
+            return Patch(), None, more_comments_style(None)
+        items, cursor = comment_page(callback_context.triggered_id['index'], before=cursor)
+        older = Patch()
+        older.extend(items)
+        return older, cursor, more_comments_style(cursor)
@@ -0,0 +1,100 @@
+import os
+import time
+import tempfile
+
+LAUNCHED = time.monotonic()
+
+# -----------------------------
+# Serving
+# -----------------------------
+# gunicorn -c gunicorn.conf.py app:server
+#
+# Threaded workers: each worker process runs THREADS requests at once and
+# keeps idle keep-alive connections in its event loop rather than on a
+# thread, so many open tabs cost sockets, not threads. The callbacks are
+# short and their storage calls (SQLite, small JSON files, append-only logs)
+# release the GIL while they wait, so threads are enough to overlap them.
+# Long requests are capped in the app itself: alumni event streams and
+# upload chunks each have a per-worker limit and answer 503 + Retry-After
+# when it is reached (MAX_ALUMNI_STREAMS, MAX_CONCURRENT_UPLOADS), and an
+# upload chunk that stalls is cut off (UPLOAD_READ_TIMEOUT).
+#
+# Size WEB_CONCURRENCY to the dyno's memory, not its CPUs (which report
+# the host's): each worker is a full copy of the app's private memory, and
+# an open alumni stream holds one of its threads for up to 25s, so up to
+# workers x MAX_ALUMNI_STREAMS threads (and their stacks) sit in streams.
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+# The photo ingest pool (INGEST_WORKERS processes, default 1) runs on the
+# same dyno, next to these workers; count it in the same memory budget.
+
+# Connections a worker holds open (active or keep-alive); more wait in the
+# listen backlog rather than being refused.
+worker_connections = 1000
+backlog = 2048
+keepalive = 5
+
+# With threaded workers this is only a heartbeat: a worker whose main loop
+# stops for `timeout` seconds is restarted, but a slow or stuck request in
+# one of its threads is not. Requests bound their own time instead (event
+# streams end after 25s, upload chunks have read timeouts).
+timeout = 30
+graceful_timeout = 30
+
+# Recycle workers now and then so a slow leak never reaches the dyno limit;
+# the jitter keeps them from all restarting at once.
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")  # e.g. "-" for stdout
+errorlog = "-"
+
+# -----------------------------
+# Metrics
+# -----------------------------
+# Workers share METRICS_DIR (metrics.py); processes started any other way
+# keep theirs private. The directory starts empty with each server; a
+# worker flushes its snapshot as it exits and the master then folds it
+# into the totals, so restarts neither lose counts nor count them twice.
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "kensap-metrics"))
+
+def on_starting(server):
+    import metrics
+    metrics.clear_dir()
+
+def worker_exit(server, worker):
+    import metrics
+    metrics.flush()
+
+def child_exit(server, worker):
+    import metrics
+    metrics.retire(worker.pid)
+
+# -----------------------------
+# Warm start
+# -----------------------------
+# The master imports the app and warms it once (warmup.py); workers fork
+# from it ready to serve. Code changes need a restart, not a HUP.
+preload_app = True
+
+def when_ready(server):
+    import app
+    import warmup
+    warmup.run(app.server, app.page_layout, freeze=True)
+    warmup.report(f"master ready {time.monotonic() - LAUNCHED:.2f} s after launch")
+
+# -----------------------------
+# Worker threads
+# -----------------------------
+# Each worker flushes its metrics snapshot in the background (see Metrics
+# above). Uploads land on this machine's disk, so they are processed here
+# too: every worker starts the ingest watcher, and the one holding
+# data/ingest's lock runs it (ingest.watch_in_background). By hand,
+# `python ingest.py run` refuses to start while a worker holds the lock.
+def post_worker_init(worker):
+    import ingest
+    import metrics
+    metrics.start_flusher()
+    ingest.watch_in_background()
@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import datastore
+import photo_index
+import thumbnails
+from metrics import inc, observe, flush
+
+try:
+    import fcntl
+except ImportError:  # Windows: nothing stops two workers running at once
+    fcntl = None
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# New photos are hashed, indexed and resized here, in a pool of worker
+# processes, instead of on a web request. Photos arrive either straight
+# in static/photos (copied in by hand) or in data/ingest/inbox (uploads),
+# which are only moved into the gallery once their derivatives exist.
+PHOTOS_FOLDER = "static/photos"
+INGEST_FOLDER = "data/ingest"
+INBOX_FOLDER = os.path.join(INGEST_FOLDER, "inbox")
+FAILED_FOLDER = os.path.join(INGEST_FOLDER, "failed")
+STATUS_FILE = os.path.join(INGEST_FOLDER, "status.json")
+LOCK_FILE = os.path.join(INGEST_FOLDER, "worker.lock")
+
+# The pool runs inside a web dyno (gunicorn.conf.py), where cpu_count()
+# reports the host's CPUs; each process decodes full-size images, so size
+# this to the dyno's memory, like WEB_CONCURRENCY.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
+QUEUE_PER_WORKER = 2      # jobs handed to the pool at once, per process
+MAX_ATTEMPTS = 3
+WATCH_INTERVAL = float(os.environ.get("INGEST_WATCH_INTERVAL", "2"))
+STATUS_INTERVAL = 1.0
+LOCK_RETRY_INTERVAL = 10  # seconds between a web worker's tries to take over
+
+# The pool is started from threaded processes (the web workers), where a
+# plain fork can copy a lock some other thread holds; its processes also
+# must not inherit the runner's lock file.
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+for folder in (INBOX_FOLDER, FAILED_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+
+# -----------------------------
+# Work done in the pool
+# -----------------------------
+def process_photo(filename, path):
+    """Hash, index and build every derivative of one photo; return its index entry."""
+    started = time.perf_counter()
+    entry = photo_index.index_photo(filename, path)
+    thumbnails.build_all(filename, path)
+    return entry, time.perf_counter() - started
+
+# -----------------------------
+# Finding work
+# -----------------------------
+class Job:
+    def __init__(self, filename, path, inbox):
+        self.filename = filename  # name in the gallery
+        self.path = path          # where the file is now
+        self.inbox = inbox
+        self.attempts = 0
+        self.suspect = False      # was in the pool when a process died
+
+def unique_name(name, taken):
+    base, ext = os.path.splitext(os.path.basename(name))
+    candidate, n = base + ext, 1
+    while candidate in taken or os.path.exists(os.path.join(PHOTOS_FOLDER, candidate)):
+        candidate = f"{base}-{n}{ext}"
+        n += 1
+    return candidate
+
+def find_jobs(index, failed):
+    """Photos in static/photos the index does not match, then inbox files.
+
+    `failed` maps paths to the (size, mtime) they failed with, so a broken
+    file is retried only after it changes.
+    """
+    jobs, taken = [], set()
+    for filename in sorted(os.listdir(PHOTOS_FOLDER)):
+        if not filename.lower().endswith(photo_index.PHOTO_EXTENSIONS):
+            continue
+        path = os.path.join(PHOTOS_FOLDER, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if photo_index.is_current(index.get(filename), st) or failed.get(path) == (st.st_size, st.st_mtime_ns):
+            continue
+        jobs.append(Job(filename, path, inbox=False))
+
+    for name in sorted(os.listdir(INBOX_FOLDER)):
+        path = os.path.join(INBOX_FOLDER, name)
+        if name.startswith(".") or name.endswith(".tmp") or not os.path.isfile(path):
+            continue  # still being written
+        if not name.lower().endswith(photo_index.PHOTO_EXTENSIONS):
+            os.replace(path, os.path.join(FAILED_FOLDER, name))
+            continue
+        filename = unique_name(name, taken)
+        taken.add(filename)
+        jobs.append(Job(filename, path, inbox=True))
+    return jobs
+
+def enqueue_file(src, name=None):
+    """Hand a finished file to the worker by moving it into the inbox.
+
+    `src` must be on the same filesystem as data/ingest. Returns the name
+    it was queued under.
+    """
+    base, ext = os.path.splitext(os.path.basename(name or src))
+    candidate, n = base + ext, 1
+    while True:
+        try:
+            # link() never overwrites, so two uploads of IMG.jpg both survive
+            os.link(src, os.path.join(INBOX_FOLDER, candidate))
+            break
+        except FileExistsError:
+            candidate = f"{base}-{n}{ext}"
+            n += 1
+    os.remove(src)
+    return candidate
+
+# -----------------------------
+# Progress reporting
+# -----------------------------
+class Progress:
+    """Writes data/ingest/status.json (at most once a second) and logs to stderr."""
+
+    def __init__(self, total, quiet=False):
+        self.state = {"state": "running", "total": total, "done": 0, "duplicates": 0,
+                      "failed": [], "retries": 0, "started": time.time(), "updated": None}
+        self.quiet = quiet
+        self.written = 0.0
+
+    def log(self, message):
+        if not self.quiet:
+            print(f"[{self.state['done']}/{self.state['total']}] {message}", file=sys.stderr)
+
+    def write(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.written < STATUS_INTERVAL:
+            return
+        self.written = now
+        self.state["updated"] = time.time()
+        write_status(self.state)
+
+def write_status(state):
+    datastore.write_json_atomic(STATUS_FILE, state)
+
+def read_status():
+    status = datastore.read_json(STATUS_FILE)
+    return status if isinstance(status, dict) else {"state": "idle"}
+
+# -----------------------------
+# Running a batch
+# -----------------------------
+def _finish(job, entry, index, progress):
+    """Record a processed photo; returns False if it was a duplicate."""
+    if job.inbox:
+        known = {e.get("sha256") for name, e in index.items() if name != job.filename}
+        if entry["sha256"] in known:
+            os.remove(job.path)
+            thumbnails.evict_stale(job.filename)
+            progress.state["duplicates"] += 1
+            inc("kensap_ingest_photos_total", {"result": "duplicate"})
+            progress.log(f"{job.filename}: duplicate, discarded")
+            return False
+    index[job.filename] = entry
+    # Index first, then publish: the photo appears with its placeholder.
+    photo_index.save_index(index)
+    if job.inbox:
+        os.replace(job.path, os.path.join(PHOTOS_FOLDER, job.filename))
+    return True
+
+def _fail(job, error, failed, progress):
+    progress.state["failed"].append({"file": job.filename, "error": str(error)})
+    inc("kensap_ingest_photos_total", {"result": "failed"})
+    progress.log(f"{job.filename}: failed after {job.attempts} attempt(s): {error}")
+    if job.inbox:
+        os.replace(job.path, os.path.join(FAILED_FOLDER, os.path.basename(job.path)))
+    else:
+        try:
+            st = os.stat(job.path)
+            failed[job.path] = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+
+def prune(index):
+    """Drop index entries for photos that are gone."""
+    present = set(os.listdir(PHOTOS_FOLDER))
+    gone = [name for name in index if name not in present]
+    for name in gone:
+        del index[name]
+    if gone:
+        photo_index.save_index(index)
+        thumbnails.evict_stale()
+
+def run_once(workers=None, failed=None, quiet=False):
+    """Process everything waiting; return the final progress state."""
+    workers = workers or INGEST_WORKERS
+    failed = {} if failed is None else failed
+    index = dict(photo_index.load_index())
+    prune(index)
+    jobs = find_jobs(index, failed)
+    progress = Progress(len(jobs), quiet)
+    if not jobs:
+        return progress.state
+
+    waiting = list(reversed(jobs))  # pop() takes them in order
+    running = {}
+
+    def retry_or_fail(job, error):
+        if job.attempts < MAX_ATTEMPTS:
+            progress.state["retries"] += 1
+            waiting.append(job)
+        else:
+            progress.state["done"] += 1
+            _fail(job, error, failed, progress)
+        progress.write()
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT)
+    try:
+        while waiting or running:
+            # Bounded queue: the pool never holds more than a couple of
+            # jobs per process, so memory stays flat however big the batch.
+            # A suspect runs on its own, so a second crash is its own.
+            while waiting and len(running) < workers * QUEUE_PER_WORKER:
+                if running and (waiting[-1].suspect or any(j.suspect for j in running.values())):
+                    break
+                job = waiting.pop()
+                job.attempts += 1
+                running[pool.submit(process_photo, job.filename, job.path)] = job
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            crashed, error = [], None
+            for future in done:
+                job = running.pop(future)
+                try:
+                    entry, seconds = future.result()
+                except BrokenProcessPool as e:
+                    crashed.append(job)  # a child died (out of memory?); the whole pool is gone
+                    error = e
+                except Exception as e:
+                    retry_or_fail(job, e)
+                else:
+                    progress.state["done"] += 1
+                    if _finish(job, entry, index, progress):
+                        inc("kensap_ingest_photos_total", {"result": "ok"})
+                        observe("kensap_ingest_duration_seconds", {}, seconds)
+                        progress.log(f"{job.filename} ({seconds:.2f}s)")
+                    progress.write()
+
+            if crashed:
+                crashed.extend(running.values())
+                running.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT)
+                if len(crashed) == 1:
+                    retry_or_fail(crashed[0], error)
+                    continue
+                # Any of them may have killed it: none is charged, and each
+                # runs alone next so the one that did is found.
+                for job in crashed:
+                    job.attempts -= 1
+                    job.suspect = True
+                    progress.state["retries"] += 1
+                    waiting.append(job)
+                progress.write()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        progress.state["state"] = "idle"
+        progress.write(force=True)
+        flush()
+    return progress.state
+
+# -----------------------------
+# Single runner
+# -----------------------------
+def acquire_lock():
+    """Return an open, exclusively locked file, or None if another worker runs."""
+    f = open(LOCK_FILE, "a")
+    if fcntl:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+def watch(workers=None, interval=None):
+    """Poll static/photos and the inbox, processing new files as they appear."""
+    interval = interval or WATCH_INTERVAL
+    failed = {}
+    seen = None
+    while True:
+        # Cheap check first: a run only starts when a folder or the index
+        # changed (including files that arrived during the previous run).
+        stamp = (os.stat(PHOTOS_FOLDER).st_mtime_ns, os.stat(INBOX_FOLDER).st_mtime_ns,
+                 photo_index.index_stamp())
+        if stamp != seen:
+            seen = stamp
+            run_once(workers, failed)
+        time.sleep(interval)
+
+def watch_in_background(workers=None):
+    """Run watch() in a daemon thread of this process whenever it can take
+    the lock. Every web worker calls this (gunicorn.conf.py), so uploads
+    are processed on the machine that received them, and another worker
+    takes over if the one holding the lock exits."""
+    def run():
+        while True:
+            lock = acquire_lock()
+            if lock is not None:
+                with lock:
+                    try:
+                        watch(workers)
+                    except Exception as e:
+                        print(f"[ingest {os.getpid()}] watcher stopped: {e!r}", file=sys.stderr, flush=True)
+            time.sleep(LOCK_RETRY_INTERVAL)
+
+    thread = threading.Thread(target=run, name="ingest-watch", daemon=True)
+    thread.start()
+    return thread
+
+# -----------------------------
+# Command line: python ingest.py run|watch|status
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and resize new gallery photos in the background.")
+    parser.add_argument("command", choices=["run", "watch", "status"],
+                        help="run: process what is waiting and exit; watch: keep polling; "
+                             "status: print the last progress report")
+    parser.add_argument("--workers", type=int, help=f"processes to use (default {INGEST_WORKERS})")
+    parser.add_argument("--interval", type=float, help=f"seconds between polls (default {WATCH_INTERVAL})")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        print(json.dumps(read_status(), indent=2))
+        return
+
+    lock = acquire_lock()
+    if lock is None:
+        print("Another ingest worker is already running.", file=sys.stderr)
+        sys.exit(1)
+    with lock:
+        if args.command == "run":
+            state = run_once(args.workers)
+            print(f"{state['done']} photo(s) processed, {state['duplicates']} duplicate(s), "
+                  f"{len(state['failed'])} failed.", file=sys.stderr)
+            sys.exit(1 if state["failed"] else 0)
+        watch(args.workers, args.interval)
+
+if __name__ == "__main__":
+    main()
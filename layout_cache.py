@@ -0,0 +1,72 @@
+import os
+import threading
+from collections import OrderedDict
+from plotly.io.json import to_json_plotly
+
+# -----------------------------
+# Settings
+# -----------------------------
+# Upper bound on the serialized size of all cached layouts in one process.
+LAYOUT_CACHE_MAX_BYTES = int(os.environ.get("LAYOUT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# -----------------------------
+# Cache
+# -----------------------------
+class LayoutCache:
+    """LRU cache of built Dash component trees.
+
+    Each entry is stored with a version (e.g. a directory mtime); asking for
+    a different version rebuilds it. Sizes are measured as the JSON Dash
+    would send, and least-recently-used pages are dropped past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=LAYOUT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (version, layout, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build, version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        layout = build()
+        size = len(to_json_plotly(layout))
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            if size <= self.max_bytes:
+                self.entries[key] = (version, layout, size)
+                self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, dropped) = self.entries.popitem(last=False)
+                self.total_bytes -= dropped
+                self.evictions += 1
+        return layout
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+            }
+
+pages = LayoutCache()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import functools
+import threading
+from flask import Response, g, request
+import datastore
+from layout_cache import pages
+
+# -----------------------------
+# Settings
+# -----------------------------
+# Every worker process keeps its own counters and writes a snapshot to
+# METRICS_DIR (at most every FLUSH_INTERVAL seconds, and at exit); /metrics
+# adds up the snapshots of all workers, so any worker can answer a scrape.
+# When a worker exits, the gunicorn master folds its snapshot into
+# TOTALS_FILE and removes it (see gunicorn.conf.py).
+#
+# gunicorn.conf.py sets METRICS_DIR for the server. Any other process
+# (command line tools, benchmark runs) gets a private directory, removed
+# at exit, so its numbers never mix into the server's.
+METRICS_DIR = os.environ.get("METRICS_DIR") or tempfile.mkdtemp(prefix="kensap-metrics-")
+PRIVATE_DIR = "METRICS_DIR" not in os.environ
+TOTALS_FILE = "totals.json"
+FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    "kensap_callback_requests_total": ("counter", "Dash callback requests.", None),
+    "kensap_callback_duration_seconds": ("histogram", "Dash callback latency.", LATENCY_BUCKETS),
+    "kensap_callback_request_bytes": ("histogram", "Dash callback request body size.", SIZE_BUCKETS),
+    "kensap_callback_response_bytes": ("histogram", "Dash callback response body size.", SIZE_BUCKETS),
+    "kensap_storage_duration_seconds": ("histogram", "Time spent reading and writing data stores.", LATENCY_BUCKETS),
+    "kensap_layout_cache_events_total": ("counter", "Page layout cache hits, misses and evictions.", None),
+    "kensap_datastore_cache_events_total": ("counter", "JSON file cache hits, misses and evictions.", None),
+    "kensap_ingest_photos_total": ("counter", "Photos processed by the ingest worker, by result.", None),
+    "kensap_ingest_duration_seconds": ("histogram", "Time to index and resize one photo.", LATENCY_BUCKETS),
+    "kensap_uploads_total": ("counter", "Finished photo uploads, by result.", None),
+    "kensap_first_request_duration_seconds": ("histogram", "Latency of each worker's first request.", LATENCY_BUCKETS),
+}
+
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+# -----------------------------
+# Per-process registry
+# -----------------------------
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_last_flush = [0.0]
+_dirty = [False]  # samples recorded since the last flush
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, labels, amount=1):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+        _dirty[0] = True
+    _maybe_flush()
+
+def observe(name, labels, value):
+    buckets = METRICS[name][2]
+    with _lock:
+        key = _key(name, labels)
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * len(buckets) + [0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+        _dirty[0] = True
+    _maybe_flush()
+
+def reset():
+    """Empty this process's registry (workers forked from a preloaded master
+    must not report the master's numbers again)."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def timed(store, operation):
+    """Decorator recording how long a storage function takes."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe("kensap_storage_duration_seconds", {"store": store, "op": operation},
+                        time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+# -----------------------------
+# Cross-worker snapshots
+# -----------------------------
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f"{pid or os.getpid()}.json")
+
+def _snapshot(counters, histograms):
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), series] for (name, labels), series in histograms.items()],
+    }
+
+def flush():
+    with _lock:
+        snapshot = _snapshot(_counters, _histograms)
+        _last_flush[0] = time.monotonic()
+        _dirty[0] = False
+    datastore.write_json_atomic(_snapshot_path(), snapshot)
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush[0] >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError:
+            pass
+
+def start_flusher():
+    """Flush every FLUSH_INTERVAL seconds while there are unsaved samples, so
+    the last ones a worker records before going idle still reach a scrape
+    answered by any other worker (gunicorn.conf.py starts this per worker)."""
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if _dirty[0]:
+                try:
+                    flush()
+                except OSError:
+                    pass
+
+    thread = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    thread.start()
+    return thread
+
+def _read_snapshot(path):
+    # Read directly, not through datastore's cache: a scrape must not move
+    # the cache counters it reports.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return snapshot if isinstance(snapshot, dict) else None
+
+def _add(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for metric, labels, value in snapshot.get("counters", []):
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for metric, labels, series in snapshot.get("histograms", []):
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(series))
+            for i, v in enumerate(series):
+                total[i] += v
+    return counters, histograms
+
+def collect():
+    """Sum the snapshots of every worker, and of those that have exited."""
+    snapshots = (_read_snapshot(os.path.join(METRICS_DIR, name))
+                 for name in os.listdir(METRICS_DIR) if name.endswith(".json"))
+    return _add(s for s in snapshots if s)
+
+def retire(pid):
+    """Fold an exited worker's snapshot into the totals and remove it, so its
+    counts are kept once and a reused pid starts from zero."""
+    path = _snapshot_path(pid)
+    snapshot = _read_snapshot(path)
+    if snapshot is None:
+        return
+    totals_path = os.path.join(METRICS_DIR, TOTALS_FILE)
+    totals = _add(s for s in (_read_snapshot(totals_path), snapshot) if s)
+    datastore.write_json_atomic(totals_path, _snapshot(*totals))
+    os.remove(path)
+
+def clear_dir():
+    """Forget every snapshot (the gunicorn master, when it starts)."""
+    for name in os.listdir(METRICS_DIR):
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except FileNotFoundError:
+            pass
+
+def _at_exit():
+    if PRIVATE_DIR:
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+        return
+    try:
+        flush()
+    except OSError:
+        pass
+
+atexit.register(_at_exit)
+
+# -----------------------------
+# Prometheus text format
+# -----------------------------
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        else:
+            for (metric, labels), series in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                # snapshots store per-bucket counts already cumulative
+                for bound, count in zip(buckets, series):
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {series[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+# -----------------------------
+# Flask hooks and route
+# -----------------------------
+def instrument(app):
+    """Time every Dash callback and serve the merged metrics at /metrics.
+
+    Call after all callbacks are registered.
+    """
+    server = app.server
+    names = {output: entry["callback"].__name__
+             for output, entry in app.callback_map.items() if "callback" in entry}
+
+    @server.before_request
+    def start_timer():
+        if request.path.endswith("/_dash-update-component"):
+            g.metrics_started = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        body = request.get_json(silent=True) or {}
+        labels = {"callback": names.get(body.get("output"), "unknown")}
+        observe("kensap_callback_duration_seconds", labels, time.perf_counter() - started)
+        observe("kensap_callback_request_bytes", labels, request.content_length or 0)
+        observe("kensap_callback_response_bytes", labels, response.calculate_content_length() or 0)
+        inc("kensap_callback_requests_total", dict(labels, status=str(response.status_code)))
+        record_cache_stats()
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        record_cache_stats()
+        flush()
+        return Response(render(*collect()), mimetype="text/plain; version=0.0.4")
+
+_cache_seen = {}
+
+def record_cache_stats():
+    """Fold the caches' own counters into this process's registry."""
+    for metric, cache in (("kensap_layout_cache_events_total", pages),
+                          ("kensap_datastore_cache_events_total", datastore.cache)):
+        stats = cache.stats()
+        with _lock:
+            seen = _cache_seen.setdefault(metric, {})
+            deltas = {}
+            for event in ("hits", "misses", "evictions"):
+                deltas[event] = stats[event] - seen.get(event, 0)
+                seen[event] = stats[event]
+        for event, delta in deltas.items():
+            if delta:
+                inc(metric, {"event": event}, delta)
@@ -0,0 +1,155 @@
+import os
+import re
+import io
+import sys
+import base64
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from PIL import Image, ImageFilter, ImageOps
+
+import datastore
+from metrics import timed
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# data/photo_index.json maps each photo in static/photos to its size,
+# mtime, pixel dimensions, capture date, sha256 and a tiny blurred
+# placeholder. Only files whose size or mtime changed are re-read.
+PHOTOS_FOLDER = "static/photos"
+PHOTO_INDEX_FILE = "data/photo_index.json"
+PHOTO_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+PLACEHOLDER_WIDTH = 16
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_ORIENTATION = 0x0112
+# WhatsApp strips EXIF but keeps the date in the name: IMG-20251115-WA0002.jpg
+FILENAME_DATE = re.compile(r"(20\d{2})(\d{2})(\d{2})")
+
+os.makedirs("data", exist_ok=True)
+
+# -----------------------------
+# Reading one photo
+# -----------------------------
+def capture_date(img, filename, mtime_ns):
+    """Best guess at when the photo was taken, as 'YYYY-MM-DD HH:MM:SS'."""
+    exif = img.getexif()
+    raw = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    if raw:
+        try:
+            return datetime.strptime(str(raw).strip("\x00 "), "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    match = FILENAME_DATE.search(filename)
+    if match:
+        return f"{match.group(1)}-{match.group(2)}-{match.group(3)} 00:00:00"
+    return datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+def placeholder(img):
+    """A ~16px wide blurred JPEG as a data: URI, shown while the photo loads."""
+    small = img.convert("RGB")
+    small.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    small.save(buf, "JPEG", quality=40)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+def index_photo(filename, path=None):
+    path = path or os.path.join(PHOTOS_FOLDER, filename)
+    st = os.stat(path)
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+
+    with Image.open(path) as img:
+        taken = capture_date(img, filename, st.st_mtime_ns)
+        width, height = img.size
+        if img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width  # displayed rotated by 90 degrees
+        # decode at reduced size: we only need a few pixels for the placeholder
+        img.draft("RGB", (PLACEHOLDER_WIDTH * 8, PLACEHOLDER_WIDTH * 8))
+        entry = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "width": width,
+            "height": height,
+            "taken": taken,
+            "sha256": digest.hexdigest(),
+            "placeholder": placeholder(ImageOps.exif_transpose(img)),
+        }
+    return entry
+
+# -----------------------------
+# Loading and saving the index
+# -----------------------------
+_lock = threading.Lock()
+
+def index_stamp():
+    """Changes whenever the index file is rewritten."""
+    try:
+        st = os.stat(PHOTO_INDEX_FILE)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+@timed("photo_index", "read")
+def load_index():
+    """Return {filename: entry}, re-read only when the file changed.
+
+    The dict is shared with other callers; copy it before changing it.
+    """
+    index = datastore.read_json(PHOTO_INDEX_FILE, {})
+    return index if isinstance(index, dict) else {}
+
+@timed("photo_index", "write")
+def save_index(index):
+    datastore.write_json_atomic(PHOTO_INDEX_FILE, index)
+
+def is_current(entry, st):
+    return entry is not None and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+
+def refresh(progress=None):
+    """Index new or changed photos, drop deleted ones; return the index."""
+    with _lock:
+        index = dict(load_index())
+        changed = False
+        filenames = [f for f in os.listdir(PHOTOS_FOLDER) if f.lower().endswith(PHOTO_EXTENSIONS)]
+        for i, filename in enumerate(filenames, 1):
+            try:
+                st = os.stat(os.path.join(PHOTOS_FOLDER, filename))
+                if is_current(index.get(filename), st):
+                    continue
+                index[filename] = index_photo(filename)
+            except (OSError, Image.UnidentifiedImageError):
+                index.pop(filename, None)  # unreadable; shown without metadata
+            changed = True
+            if progress:
+                progress(i, len(filenames), filename)
+        for filename in set(index) - set(filenames):
+            del index[filename]
+            changed = True
+        if changed:
+            save_index(index)
+        return index
+
+def sort_key(filename, entry):
+    """Newest photo first when sorted in reverse."""
+    return [(entry or {}).get("taken") or "", filename]
+
+# -----------------------------
+# Command line: python photo_index.py
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update data/photo_index.json.")
+    parser.parse_args(argv)
+    index = refresh(progress=lambda i, n, name: print(f"[{i}/{n}] {name}", file=sys.stderr))
+    print(f"{len(index)} photo(s) indexed.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,18 @@
-import os
-import json
-from dash import html, dcc
+from dash import html, dcc, Patch
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 
-USERS_FOLDER = "users"
-if not os.path.exists(USERS_FOLDER):
-    os.makedirs(USERS_FOLDER)
+import profile_store
 
-def layout(user_session):
+def layout():
     return html.Div([
         dbc.Container([
             html.H2("Your Personal Profile", className="text-center", style={"marginTop": "30px"}),
             html.Hr(),
             html.Div(id="profile-display", style={"marginTop": "20px"}),
+            dbc.Button("Load older", id="profile-load-older", color="secondary", n_clicks=0,
+                       style={"display": "none"}),
+            dcc.Store(id="profile-cursor"),
             html.Hr(),
             html.Div([
                 html.H4("Add or Update Your Info:"),
@@ -29,10 +28,6 @@ def layout(user_session):
         dcc.Store(id="current-user", storage_type="session")  # <-- removed data=..., now uses global session
     ])
 
-def get_profile_path(username):
-    safe_username = username.replace(" ", "_")
-    return os.path.join(USERS_FOLDER, f"{safe_username}.json")
-
 # -----------------------------
 # Helper to get current username
 # -----------------------------
@@ -42,26 +37,42 @@ def get_current_username(user_session):
         return user_session["username"]
     return "Unknown User"
 
+def older_button_style(cursor):
+    return {"display": "block" if cursor else "none", "marginTop": "10px"}
+
 def register_callbacks(app):
     @app.callback(
         Output("profile-display", "children"),
+        Output("profile-cursor", "data"),
+        Output("profile-load-older", "style"),
         Input("user-session", "data")  # <-- changed to global session
     )
     def display_profile(user_session):
         if not user_session:
-            return html.P("Please log in to view your profile.")
+            return [html.P("Please log in to view your profile.")], None, older_button_style(None)
         username = user_session.get("username")
-        profile_file = get_profile_path(username)
-        if not os.path.exists(profile_file):
-            return html.P("No info yet. Add your info below!")
-        with open(profile_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        info_content = data.get("info", "No info yet.")
-        if isinstance(info_content, list):
-            # newest info on top
-            return html.Div([html.P(item) for item in reversed(info_content)])
-        else:
-            return html.P(info_content)
+        entries, cursor = profile_store.read_entries(username)
+        if not entries:
+            return [html.P("No info yet. Add your info below!")], None, older_button_style(None)
+        # newest info on top
+        return [html.P(item) for item in entries], cursor, older_button_style(cursor)
+
+    @app.callback(
+        Output("profile-display", "children", allow_duplicate=True),
+        Output("profile-cursor", "data", allow_duplicate=True),
+        Output("profile-load-older", "style", allow_duplicate=True),
+        Input("profile-load-older", "n_clicks"),
+        State("profile-cursor", "data"),
+        State("user-session", "data"),
+        prevent_initial_call=True
+    )
+    def load_older_profile(n_clicks, cursor, user_session):
+        if not user_session or not cursor:
+            return Patch(), None, older_button_style(None)
+        entries, cursor = profile_store.read_entries(user_session.get("username"), before=cursor)
+        older = Patch()
+        older.extend([html.P(item) for item in entries])
+        return older, cursor, older_button_style(cursor)
 
     @app.callback(
         Output("profile-output", "children"),
@@ -77,22 +88,8 @@ def register_callbacks(app):
         if not info_text:
             return "Please enter some text to save.", ""
         username = user_session.get("username")
-        profile_file = get_profile_path(username)
-
-        # Read existing info if present
-        existing_info = []
-        if os.path.exists(profile_file):
-            with open(profile_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                existing_info = data.get("info", [])
-                if isinstance(existing_info, str):  # convert old string format to list
-                    existing_info = [existing_info]
-
-        # Append new info on top
-        existing_info.append(info_text.strip())
 
-        # Save updated info
-        with open(profile_file, "w", encoding="utf-8") as f:
-            json.dump({"info": existing_info}, f, ensure_ascii=False)
+        # One appended line; the existing history is never read or rewritten.
+        profile_store.append_entry(username, info_text.strip())
 
         return "Your info has been saved successfully!", ""
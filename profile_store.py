@@ -0,0 +1,116 @@
+import os
+import json
+from datetime import datetime
+
+import datastore
+from metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still single writes, just unlocked
+    fcntl = None
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# Profile entries are kept in an append-only log (users/<name>.jsonl, one
+# entry per line, oldest first). Saving appends one line; the page reads
+# only the newest PROFILE_PAGE_SIZE lines from the end of the file and
+# pages back through older ones with a byte-offset cursor.
+USERS_FOLDER = "users"
+PROFILE_PAGE_SIZE = 10
+READ_CHUNK = 8192
+
+os.makedirs(USERS_FOLDER, exist_ok=True)
+
+def get_profile_path(username):
+    """Legacy whole-file profile ({"info": [...]}), read only for migration."""
+    safe_username = username.replace(" ", "_")
+    return os.path.join(USERS_FOLDER, f"{safe_username}.json")
+
+def get_log_path(username):
+    safe_username = username.replace(" ", "_")
+    return os.path.join(USERS_FOLDER, f"{safe_username}.jsonl")
+
+# -----------------------------
+# Profile log
+# -----------------------------
+def migrate_legacy_profile(username):
+    """Turn users/<name>.json into users/<name>.jsonl the first time it is needed."""
+    log_path = get_log_path(username)
+    legacy_path = get_profile_path(username)
+    if os.path.exists(log_path) or not os.path.exists(legacy_path):
+        return
+
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        info = json.load(f).get("info", [])
+    if isinstance(info, str):  # convert old string format to list
+        info = [info]
+
+    try:
+        # A log another worker already created (and maybe appended to) is
+        # never replaced.
+        with datastore.atomic_write(log_path, replace=False) as f:
+            for text in info:
+                f.write(json.dumps({"text": text}, ensure_ascii=False) + "\n")
+    except FileExistsError:
+        pass
+
+@timed("profile", "write")
+def append_entries(username, entries):
+    """Append (text, saved_at) entries to the user's log with a single fsync."""
+    migrate_legacy_profile(username)
+    lines = "".join(json.dumps({"text": text, "saved_at": saved_at}, ensure_ascii=False) + "\n"
+                    for text, saved_at in entries)
+    with open(get_log_path(username), "a", encoding="utf-8") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def append_entry(username, text):
+    append_entries(username, [(text, datetime.utcnow().isoformat(timespec="seconds"))])
+
+@timed("profile", "read")
+def read_entries(username, before=None, limit=PROFILE_PAGE_SIZE):
+    """Return (entries newest first, cursor for the next older page or None).
+
+    `before` is a byte offset returned by a previous call; only the tail of
+    the log up to that point is read.
+    """
+    migrate_legacy_profile(username)
+    path = get_log_path(username)
+    if not os.path.exists(path):
+        return [], None
+
+    found = []  # (start offset, raw line), newest first
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell() if before is None else min(before, f.tell())
+        head = b""  # bytes from pos up to the oldest line already taken
+        while pos > 0 and len(found) < limit:
+            size = min(READ_CHUNK, pos)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + head).split(b"\n")
+            head = lines[0]  # may be the tail end of an older line
+            start = pos + len(head) + 1
+            complete = []
+            for line in lines[1:]:
+                complete.append((start, line))
+                start += len(line) + 1
+            for start, line in reversed(complete):
+                if line.strip() and len(found) < limit:
+                    found.append((start, line))
+        if pos == 0 and head.strip() and len(found) < limit:
+            found.append((0, head))
+
+    entries = []
+    for _, line in found:
+        try:
+            entries.append(json.loads(line)["text"])
+        except (ValueError, KeyError):
+            continue
+    cursor = found[-1][0] if found and found[-1][0] > 0 else None
+    return entries, cursor
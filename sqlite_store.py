@@ -0,0 +1,73 @@
+import os
+import json
+import sqlite3
+import threading
+
+# -----------------------------
+# Shared SQLite setup
+# -----------------------------
+# The SQLite-backed stores (user_store, comments_store) each open one
+# Database: WAL mode so readers never wait for a writer, one connection per
+# thread (reopened after a fork, so gunicorn workers never share the
+# master's), and a meta table recording one-off migrations.
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class Database:
+    def __init__(self, path, schema, row_factory=None):
+        self.path = path
+        self.schema = schema
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def connect(self):
+        """Return this thread's connection, reopening it after a fork."""
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is None or local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            if self.row_factory:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+            local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        """Close this thread's connection, e.g. in the gunicorn master before it forks."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init(self):
+        conn = self.connect()
+        conn.executescript(self.schema + META_SCHEMA)
+        return conn
+
+    def run_once(self, key, migrate):
+        """Run migrate(conn) in one write transaction unless `key` is already
+        recorded in meta; record its result (e.g. a row count) under `key`."""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if not done:
+                conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, str(migrate(conn))))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+def load_legacy_json(path):
+    """The parsed contents of an old JSON store, or None if missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
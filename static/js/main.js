@@ -0,0 +1,403 @@
+// -----------------------------
+// Gallery infinite scroll
+// -----------------------------
+// The gallery only renders one page of photos; when the "Load more" button
+// (marked with .gallery-autoload) scrolls into view we click it for the user.
+(function () {
+    var observed = null;
+    var pendingCount = null;   // number of cards on screen when we last clicked
+    var pendingSince = 0;
+
+    function cardCount() {
+        var photos = document.getElementById("gallery-photos");
+        return photos ? photos.children.length : 0;
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting && pendingCount === null) {
+                // Stop observing until the new page has landed so one scroll
+                // never requests the same page twice.
+                pendingCount = cardCount();
+                pendingSince = Date.now();
+                observer.unobserve(entry.target);
+                observed = null;
+                entry.target.click();
+            }
+        });
+    }, { rootMargin: "600px 0px" });
+
+    function attach() {
+        if (pendingCount !== null) {
+            if (cardCount() === pendingCount && Date.now() - pendingSince < 10000) {
+                return;
+            }
+            pendingCount = null;
+        }
+        var button = document.querySelector("#gallery-load-more.gallery-autoload");
+        if (button === observed) {
+            return;
+        }
+        if (observed) {
+            observer.unobserve(observed);
+        }
+        observed = button;
+        if (button) {
+            // observe() reports the current intersection state straight away,
+            // so a short page keeps loading until the button leaves the screen.
+            observer.observe(button);
+        }
+    }
+
+    // Dash swaps page content without a reload, so watch for the button appearing.
+    new MutationObserver(attach).observe(document.documentElement, { childList: true, subtree: true });
+})();
+
+// -----------------------------
+// Lazy gallery images
+// -----------------------------
+// Photo cards arrive showing a tiny blurred placeholder (img.lazy-photo);
+// the real srcset is kept in data-src/data-srcset until the card gets close
+// to the viewport, like loading="lazy".
+(function () {
+    function load(img) {
+        var picture = img.parentNode;
+        if (picture && picture.tagName === "PICTURE") {
+            Array.prototype.forEach.call(picture.querySelectorAll("source[data-srcset]"), function (source) {
+                source.srcset = source.getAttribute("data-srcset");
+                source.removeAttribute("data-srcset");
+            });
+        }
+        img.srcset = img.getAttribute("data-srcset");
+        img.src = img.getAttribute("data-src");
+        img.removeAttribute("data-srcset");
+        img.removeAttribute("data-src");
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                load(entry.target);
+            }
+        });
+    }, { rootMargin: "300px 0px" });
+
+    function attach() {
+        var images = document.querySelectorAll("img.lazy-photo[data-src]:not([data-lazy-observed])");
+        Array.prototype.forEach.call(images, function (img) {
+            img.setAttribute("data-lazy-observed", "");
+            observer.observe(img);
+        });
+    }
+
+    new MutationObserver(attach).observe(document.documentElement, { childList: true, subtree: true });
+})();
+
+// -----------------------------
+// Photo uploads
+// -----------------------------
+// Sends each chosen file to /uploads in chunks (see uploads.py), two files
+// at a time. A failed or rejected chunk is retried from the offset the
+// server reports, so a dropped phone connection resumes instead of restarting.
+// Each request carries the token login put in the user-session store.
+(function () {
+    var PARALLEL_FILES = 2;
+    var RETRIES = 5;
+
+    function uploadToken() {
+        try {
+            var session = JSON.parse(window.sessionStorage.getItem("user-session"));
+            return (session && session.upload_token) || "";
+        } catch (e) {
+            return "";
+        }
+    }
+
+    function request(method, url, body, headers) {
+        headers = headers || {};
+        headers["X-Upload-Token"] = uploadToken();
+        return fetch(url, { method: method, body: body, headers: headers }).then(function (response) {
+            return response.json().catch(function () { return {}; }).then(function (data) {
+                data.httpStatus = response.status;
+                return data;
+            });
+        });
+    }
+
+    function wait(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    function sendFrom(file, upload, offset, report, retries) {
+        var end = Math.min(offset + upload.chunk, file.size);
+        report(Math.round(100 * offset / file.size) + "%");
+        return request("PUT", "/uploads/" + upload.id, file.slice(offset, end), {
+            "Content-Range": "bytes " + offset + "-" + (end - 1) + "/" + file.size
+        }).catch(function () {
+            return { httpStatus: 0 };
+        }).then(function (data) {
+            if (data.httpStatus === 200 && data.status) {
+                return data;
+            }
+            if (data.httpStatus === 200) {
+                return sendFrom(file, upload, data.offset, report, RETRIES);
+            }
+            if (retries <= 0 || (data.httpStatus >= 400 && data.httpStatus < 500 &&
+                                 data.httpStatus !== 408 && data.httpStatus !== 409)) {
+                throw new Error(data.error || "upload failed");
+            }
+            // Busy server, slow or dropped connection, or wrong offset: ask where we are and carry on.
+            return wait(data.httpStatus === 503 ? 2000 : 1000).then(function () {
+                return request("GET", "/uploads/" + upload.id);
+            }).then(function (status) {
+                return sendFrom(file, upload, status.offset || 0, report, retries - 1);
+            }, function () {
+                return sendFrom(file, upload, offset, report, retries - 1);
+            });
+        });
+    }
+
+    function upload(file, report) {
+        return request("POST", "/uploads", JSON.stringify({ filename: file.name, size: file.size }), {
+            "Content-Type": "application/json"
+        }).then(function (data) {
+            if (data.status) {
+                return data;
+            }
+            if (!data.id) {
+                throw new Error(data.error || "upload refused");
+            }
+            return sendFrom(file, data, 0, report, RETRIES);
+        });
+    }
+
+    function start(files, status) {
+        var queue = Array.prototype.slice.call(files);
+        function next() {
+            var file = queue.shift();
+            if (!file) {
+                return Promise.resolve();
+            }
+            var line = document.createElement("div");
+            status.appendChild(line);
+            var report = function (text) { line.textContent = file.name + ": " + text; };
+            report("starting");
+            return upload(file, report).then(function (result) {
+                report(result.status === "duplicate" ? "already in the gallery" : "uploaded, processing");
+            }, function (error) {
+                report(error.message);
+            }).then(next);
+        }
+        for (var i = 0; i < PARALLEL_FILES; i++) {
+            next();
+        }
+    }
+
+    function attach() {
+        var container = document.getElementById("gallery-upload");
+        if (!container || container.querySelector("input[type=file]")) {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.multiple = true;
+        input.accept = "image/png,image/jpeg,image/gif";
+        var status = document.createElement("div");
+        input.addEventListener("change", function () {
+            start(input.files, status);
+            input.value = "";
+        });
+        container.appendChild(input);
+        container.appendChild(status);
+    }
+
+    new MutationObserver(attach).observe(document.documentElement, { childList: true, subtree: true });
+})();
+
+// -----------------------------
+// Clientside callbacks
+// -----------------------------
+var KENSAP_PAGES = ["/login", "/homepage", "/gallery", "/alumni", "/profile"];
+var KENSAP_PUBLIC_PAGES = ["/login", "/homepage"];
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    kensap: {
+        // Shows the right page for the current URL and session. Every page
+        // but the gallery is already in the layout; the gallery's layout is
+        // requested from the server (through page-request).
+        route: function (pathname, session) {
+            var hidden = { display: "none" };
+            var shown = { display: "block" };
+            var page;
+
+            if (pathname === "/") {
+                page = session ? "/homepage" : "/login";
+            } else if (KENSAP_PUBLIC_PAGES.indexOf(pathname) === -1 && !session) {
+                // Restrict pages unless logged in
+                page = "/login";
+            } else if (KENSAP_PAGES.indexOf(pathname) !== -1) {
+                page = pathname;
+            } else {
+                page = "/login";
+            }
+
+            var gallery = page === "/gallery";
+            return [
+                page === "/login" ? shown : hidden,
+                page === "/homepage" ? shown : hidden,
+                page === "/alumni" ? shown : hidden,
+                page === "/profile" ? shown : hidden,
+                gallery ? shown : hidden,
+                // `at` makes each visit ask again, so photos added since show
+                // up; the server answers from its cached layout.
+                gallery ? { path: page, user: session.username, at: Date.now() } : window.dash_clientside.no_update
+            ];
+        },
+
+        logout: function (pathname) {
+            var no_update = window.dash_clientside.no_update;
+            if (pathname !== "/logout") {
+                return [no_update, no_update, no_update];
+            }
+            return [null, "You have logged out.", "/login"];
+        },
+
+        // Keeps one EventSource open on /alumni/events while the alumni page
+        // is shown, and closes it when the page is hidden. New names are
+        // prepended to the list right here, so a change costs one small event
+        // and no callback round trip. The first visit, a search that a new
+        // name matches, or a gap in versions asks the server (through the
+        // alumni-refresh store) to render the list.
+        subscribeAlumni: function (version, pageStyle) {
+            var no_update = window.dash_clientside.no_update;
+            var state = window.kensapAlumniStream || (window.kensapAlumniStream = { source: null, version: 0 });
+            if (typeof version === "number") {
+                state.shown = version;  // the version the list on screen reflects
+                if (version > state.version) {
+                    state.version = version;
+                }
+            }
+            state.visible = !!pageStyle && pageStyle.display !== "none";
+            if (!state.visible) {
+                clearTimeout(state.timer);
+                if (state.source) {
+                    state.source.close();
+                    state.source = null;
+                }
+                return no_update;
+            }
+            if (typeof state.shown !== "number") {
+                if (!state.requested) {
+                    state.requested = true;
+                    window.dash_clientside.set_props("alumni-refresh", { data: Date.now() });
+                }
+                return no_update;  // the stream opens once the list (and its version) arrive
+            }
+            if (state.source) {
+                return no_update;
+            }
+
+            // Same rule as alumni_store.search: the query is a prefix of one of
+            // the name's search_keys (the folded name from each word on).
+            function fold(text) {
+                return text.toLowerCase().split(/\s+/).filter(Boolean).join(" ");
+            }
+            function matches(name, query) {
+                var words = fold(name).split(" "), prefix = fold(query);
+                for (var i = 0; i < words.length; i++) {
+                    if (words.slice(i).join(" ").indexOf(prefix) === 0) {
+                        return true;
+                    }
+                }
+                return false;
+            }
+
+            function apply(delta) {
+                var set_props = window.dash_clientside.set_props;
+                var search = document.getElementById("alumni-search");
+                var query = search ? search.value.trim() : "";
+                if (delta.added === null || (!query && delta.since !== state.shown)) {
+                    set_props("alumni-refresh", { data: delta.version });
+                    return;
+                }
+                if (query) {
+                    if (delta.added.some(function (name) { return matches(name, query); })) {
+                        set_props("alumni-refresh", { data: delta.version });
+                    }
+                    return;
+                }
+                var names = new window.dash_clientside.Patch();
+                for (var i = delta.added.length - 1; i >= 0; i--) {
+                    names.prepend([], { type: "Li", namespace: "dash_html_components", props: { children: delta.added[i] } });
+                }
+                set_props("alumni-list", { children: names.build() });
+                set_props("alumni-empty", { style: { display: "none" } });
+                set_props("alumni-version", { data: delta.version });
+            }
+
+            // With jitter, so a crowd of tabs doesn't come back all at once.
+            function later(next, delay) {
+                clearTimeout(state.timer);
+                state.timer = setTimeout(next, delay / 2 + Math.random() * delay / 2);
+            }
+
+            // Refused a stream (the server's are all taken) or cut off: check
+            // /alumni/changes, which answers at once, every few seconds, and
+            // try for a stream again every POLLS_PER_STREAM checks.
+            var POLL_MS = 5000, POLLS_PER_STREAM = 6;
+            function poll() {
+                if (!state.visible || state.source) {
+                    return;
+                }
+                fetch("/alumni/changes?since=" + state.version, { cache: "no-store" }).then(function (response) {
+                    return response.status === 200 ? response.json() : null;
+                }).then(function (delta) {
+                    if (delta && state.visible) {
+                        state.version = delta.version;
+                        apply(delta);
+                    }
+                }, function () {}).then(function () {
+                    state.polls = (state.polls || 0) + 1;
+                    later(state.polls % POLLS_PER_STREAM ? poll : open, POLL_MS);
+                });
+            }
+
+            function open() {
+                if (!state.visible || state.source) {
+                    return;
+                }
+                var source = new EventSource("/alumni/events?since=" + state.version);
+                var opened = false;
+                state.source = source;
+
+                source.onmessage = function (event) {
+                    var delta = JSON.parse(event.data);
+                    state.version = delta.version;
+                    apply(delta);
+                };
+                source.onopen = function () {
+                    opened = true;
+                };
+                // The server ends each stream after a while; reconnect from
+                // the latest version we have seen rather than the original URL.
+                source.onerror = function () {
+                    source.close();
+                    if (state.source !== source) {
+                        return;  // closed because the page was hidden
+                    }
+                    state.source = null;
+                    if (opened) {
+                        later(open, 2000);
+                    } else {
+                        state.polls = 0;
+                        later(poll, POLL_MS);
+                    }
+                };
+            }
+
+            open();
+            return no_update;
+        }
+    }
+});
@@ -0,0 +1,154 @@
+import os
+import sys
+import gzip
+import shutil
+import hashlib
+import argparse
+import threading
+import mimetypes
+from flask import abort, redirect, request, send_file
+
+import datastore
+
+try:
+    import brotli
+except ImportError:  # optional: .br variants are only built if it is installed
+    brotli = None
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# Versioned URLs carry a hash of the file's content, so browsers may keep
+# them forever: a changed file gets a new URL rather than a revalidation.
+STATIC_FOLDER = "static"
+ONE_YEAR = 365 * 24 * 3600
+COMPRESSIBLE_FOLDERS = ("css", "js")
+COMPRESSED_VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+# -----------------------------
+# Content hashes
+# -----------------------------
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+def content_hash(relpath):
+    """Short sha256 of a file under static/, cached by mtime and size."""
+    path = os.path.join(STATIC_FOLDER, relpath)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _hashes_lock:
+        cached = _hashes.get(relpath)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    digest = h.hexdigest()[:16]
+    with _hashes_lock:
+        _hashes[relpath] = (stamp, digest)
+    return digest
+
+def asset_url(relpath):
+    """URL for a file under static/, e.g. asset_url("js/main.js")."""
+    return f"/static-v/{content_hash(relpath)}/{relpath}"
+
+def cache_forever(response):
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+# -----------------------------
+# Precompressed variants
+# -----------------------------
+def compress_file(path):
+    """Write .gz (and .br when brotli is installed) next to `path`."""
+    with open(path, "rb") as f:
+        data = f.read()
+    outputs = [(".gz", gzip.compress(data, compresslevel=9))]
+    if brotli:
+        outputs.append((".br", brotli.compress(data)))
+    for suffix, compressed in outputs:
+        with datastore.atomic_write(path + suffix, "wb") as f:
+            f.write(compressed)
+            f.flush()
+            shutil.copystat(path, f.name)
+    return len(outputs)
+
+def compress_assets():
+    written = 0
+    for folder in COMPRESSIBLE_FOLDERS:
+        for dirpath, _, filenames in os.walk(os.path.join(STATIC_FOLDER, folder)):
+            for name in filenames:
+                if not name.endswith((".gz", ".br", ".tmp")):
+                    written += compress_file(os.path.join(dirpath, name))
+    return written
+
+def is_compressible(relpath):
+    return relpath.split("/")[0] in COMPRESSIBLE_FOLDERS
+
+def pick_variant(path, relpath):
+    """Return (path, content-encoding) of the best fresh variant the client accepts.
+
+    css/js variants missing or older than the source are (re)built on the
+    spot, so a fresh dyno needs no separate build step.
+    """
+    if not is_compressible(relpath):
+        return path, None
+    accepted = request.accept_encodings
+    mtime = os.path.getmtime(path)
+    for encoding, suffix in COMPRESSED_VARIANTS:
+        if not accepted[encoding] or (encoding == "br" and not brotli):
+            continue
+        variant = path + suffix
+        if not os.path.exists(variant) or os.path.getmtime(variant) < mtime:
+            compress_file(path)
+        if os.path.exists(variant):
+            return variant, encoding
+    return path, None
+
+# -----------------------------
+# Routes
+# -----------------------------
+def register_routes(server):
+    @server.route("/static-v/<digest>/<path:relpath>")
+    def serve_versioned(digest, relpath):
+        path = os.path.normpath(os.path.join(STATIC_FOLDER, relpath))
+        if not path.startswith(STATIC_FOLDER + os.sep) or not os.path.isfile(path):
+            abort(404)
+
+        current = content_hash(relpath)
+        if digest != current:
+            # Page rendered before the file changed: point at the new version.
+            return redirect(f"/static-v/{current}/{relpath}")
+
+        served, encoding = pick_variant(path, relpath)
+        # send_file answers If-None-Match / If-Modified-Since with 304 and
+        # serves Range requests (206) from the file on disk.
+        response = send_file(
+            os.path.abspath(served),
+            mimetype=mimetypes.guess_type(path)[0],
+            etag=f"{digest}-{encoding}" if encoding else digest,
+            conditional=True
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if is_compressible(relpath):
+            response.vary.add("Accept-Encoding")
+        return cache_forever(response)
+
+# -----------------------------
+# Command line: python static_assets.py compress
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare static assets for serving.")
+    parser.add_argument("command", choices=["compress"],
+                        help="compress: write .gz/.br variants of static/css and static/js")
+    parser.parse_args(argv)
+    print(f"Wrote {compress_assets()} compressed file(s).", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
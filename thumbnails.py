@@ -0,0 +1,167 @@
+import os
+import sys
+import hashlib
+import argparse
+from flask import abort, redirect, send_file
+from PIL import Image, ImageOps
+import datastore
+from static_assets import cache_forever
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+PHOTOS_FOLDER = "static/photos"
+DERIVATIVES_FOLDER = os.environ.get("DERIVATIVES_FOLDER", "cache/derivatives")
+
+# Gallery cards are 300px wide: 320 covers 1x screens, 640 and 960 cover
+# 2x/3x phones. Anything larger is as heavy as the WhatsApp originals.
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+DERIVATIVE_QUALITY = 75
+CARD_SIZES = "300px"
+
+os.makedirs(DERIVATIVES_FOLDER, exist_ok=True)
+
+# -----------------------------
+# Cache keys and paths
+# -----------------------------
+def source_key(filename, path=None):
+    """Key a photo by path, mtime and size so any change to the original
+    produces new derivative names (and new URLs).
+
+    `path` lets the ingest worker prepare a photo before it is moved into
+    PHOTOS_FOLDER; a rename keeps mtime and size, so the key still matches.
+    """
+    st = os.stat(path or os.path.join(PHOTOS_FOLDER, filename))
+    raw = f"{filename}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def derivative_name(filename, key, width, ext):
+    return f"{filename}.{key}.{width}.{ext}"
+
+def derivative_path(filename, key, width, ext):
+    return os.path.join(DERIVATIVES_FOLDER, derivative_name(filename, key, width, ext))
+
+def derivative_url(filename, key, width, ext):
+    return f"/derivatives/{key}/{width}/{filename}.{ext}"
+
+def srcset(filename, ext, key=None):
+    key = key or source_key(filename)
+    return ", ".join(f"{derivative_url(filename, key, w, ext)} {w}w" for w in DERIVATIVE_WIDTHS)
+
+# -----------------------------
+# Building and eviction
+# -----------------------------
+def _prepare(img):
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+def _save(img, width, ext, target):
+    if img.width > width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS, reducing_gap=3.0)
+    # Concurrent workers never serve a half-written file.
+    with datastore.atomic_write(target, "wb") as f:
+        img.save(f, DERIVATIVE_FORMATS[ext], quality=DERIVATIVE_QUALITY, optimize=True)
+
+def build_derivative(filename, width, ext, key=None, path=None):
+    """Return the path of the requested derivative, creating it if needed."""
+    key = key or source_key(filename, path)
+    target = derivative_path(filename, key, width, ext)
+    if os.path.exists(target):
+        return target
+
+    with Image.open(path or os.path.join(PHOTOS_FOLDER, filename)) as img:
+        _save(_prepare(img), width, ext, target)
+
+    evict_stale(filename, keep_key=key)
+    return target
+
+def build_all(filename, path=None):
+    """Build every missing derivative from a single decode of the original."""
+    key = source_key(filename, path)
+    missing = [(width, ext) for width in DERIVATIVE_WIDTHS for ext in DERIVATIVE_FORMATS
+               if not os.path.exists(derivative_path(filename, key, width, ext))]
+    if not missing:
+        return
+    largest = max(width for width, _ in missing)
+    with Image.open(path or os.path.join(PHOTOS_FOLDER, filename)) as img:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale for free.
+        img.draft("RGB", (largest, largest))
+        img = _prepare(img)
+        for width, ext in missing:
+            _save(img, width, ext, derivative_path(filename, key, width, ext))
+    evict_stale(filename, keep_key=key)
+
+def evict_stale(filename=None, keep_key=None):
+    """Delete derivatives whose source changed or no longer exists.
+
+    With `filename` only that photo's older derivatives are removed; without
+    it the whole cache directory is checked. Returns the number of files removed.
+    """
+    current = {}
+    removed = 0
+    for name in os.listdir(DERIVATIVES_FOLDER):
+        parts = name.rsplit(".", 4)
+        if len(parts) != 5 or name.endswith(".tmp"):
+            continue
+        source = f"{parts[0]}.{parts[1]}"
+        key = parts[2]
+        if filename is not None and source != filename:
+            continue
+        if source not in current:
+            if keep_key is not None and source == filename:
+                current[source] = keep_key
+            elif os.path.exists(os.path.join(PHOTOS_FOLDER, source)):
+                current[source] = source_key(source)
+            else:
+                current[source] = None
+        if key != current[source]:
+            try:
+                os.remove(os.path.join(DERIVATIVES_FOLDER, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+# -----------------------------
+# Routes
+# -----------------------------
+def register_routes(server):
+    @server.route("/derivatives/<key>/<int:width>/<path:name>")
+    def serve_derivative(key, width, name):
+        filename, _, ext = name.rpartition(".")
+        if (width not in DERIVATIVE_WIDTHS or ext not in DERIVATIVE_FORMATS
+                or os.path.basename(filename) != filename
+                or not os.path.isfile(os.path.join(PHOTOS_FOLDER, filename))):
+            abort(404)
+
+        current = source_key(filename)
+        if key != current:
+            # The original changed since the page was rendered.
+            return redirect(derivative_url(filename, current, width, ext))
+
+        path = build_derivative(filename, width, ext, key=current)
+        # The key in the URL changes whenever the original does.
+        return cache_forever(send_file(os.path.abspath(path), conditional=True))
+
+# -----------------------------
+# Command line: python thumbnails.py warm|evict
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage gallery photo derivatives.")
+    parser.add_argument("command", choices=["warm", "evict"],
+                        help="warm: build every missing derivative; evict: remove stale ones")
+    args = parser.parse_args(argv)
+
+    if args.command == "warm":
+        from gallery import list_photos
+        photos = list_photos()
+        for i, filename in enumerate(photos, 1):
+            build_all(filename)
+            print(f"[{i}/{len(photos)}] {filename}", file=sys.stderr)
+    print(f"Evicted {evict_stale()} stale derivative(s).", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import os
+import re
+import time
+import socket
+import hashlib
+import secrets
+import threading
+from flask import abort, g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+import datastore
+import ingest
+import photo_index
+from metrics import inc
+
+try:
+    import fcntl
+except ImportError:  # Windows: a chunk sent twice at once is not caught
+    fcntl = None
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# Photos are uploaded in chunks straight to disk (data/uploads/<id>.part),
+# never held whole in memory or base64-encoded into a callback the way
+# dcc.Upload would. An interrupted upload resumes from the bytes already
+# on disk. Finished files go to the ingest worker's inbox.
+UPLOADS_FOLDER = "data/uploads"
+LOCK_FILE = os.path.join(UPLOADS_FOLDER, ".lock")
+SECRET_KEY_FILE = "data/secret_key"
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+MAX_CONCURRENT_CHUNKS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", "4"))  # per worker process
+UPLOAD_EXPIRY = 24 * 3600
+EXPIRE_INTERVAL = 60
+COPY_BUFFER = 64 * 1024
+
+# A chunk that stalls for READ_TIMEOUT seconds, or takes longer than
+# CHUNK_DEADLINE in all, is cut off (408) so a slow client cannot hold an
+# upload slot and its thread; what arrived is kept and the browser resumes.
+READ_TIMEOUT = float(os.environ.get("UPLOAD_READ_TIMEOUT", "15"))
+CHUNK_DEADLINE = float(os.environ.get("UPLOAD_CHUNK_DEADLINE", "120"))
+
+# Unfinished uploads reserve their full size on disk. Each user may have
+# a few open at once, and all users together at most MAX_PENDING_BYTES.
+MAX_OPEN_UPLOADS_PER_USER = int(os.environ.get("MAX_OPEN_UPLOADS_PER_USER", "4"))
+MAX_PENDING_BYTES_PER_USER = int(os.environ.get("MAX_PENDING_BYTES_PER_USER", str(200 * 1024 * 1024)))
+MAX_PENDING_BYTES = int(os.environ.get("MAX_PENDING_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Login hands the browser a signed token (kept in user-session) that every
+# upload request must carry in X-Upload-Token.
+UPLOAD_TOKEN_MAX_AGE = 24 * 3600
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)$")
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}$")
+
+os.makedirs(UPLOADS_FOLDER, exist_ok=True)
+
+# Each chunk holds a request thread while it streams in; past this many at
+# once the client is told to retry rather than queueing behind them.
+_slots = threading.BoundedSemaphore(MAX_CONCURRENT_CHUNKS)
+_last_expiry = [0.0]
+
+# -----------------------------
+# Upload tokens
+# -----------------------------
+def _secret_key():
+    """SECRET_KEY from the environment, or one made on first start and
+    shared by every worker through data/secret_key."""
+    key = os.environ.get("SECRET_KEY")
+    if key:
+        return key
+    if not os.path.exists(SECRET_KEY_FILE):
+        try:
+            # never replaces a key another process made
+            with datastore.atomic_write(SECRET_KEY_FILE, replace=False) as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+    with open(SECRET_KEY_FILE) as f:
+        return f.read()
+
+_tokens = URLSafeTimedSerializer(_secret_key(), salt="uploads")
+
+def issue_token(username):
+    return _tokens.dumps(username)
+
+def token_user():
+    """The user named by the request's upload token, or None."""
+    try:
+        return _tokens.loads(request.headers.get("X-Upload-Token", ""), max_age=UPLOAD_TOKEN_MAX_AGE)
+    except BadSignature:
+        return None
+
+# -----------------------------
+# Upload files
+# -----------------------------
+def part_path(upload_id):
+    return os.path.join(UPLOADS_FOLDER, f"{upload_id}.part")
+
+def meta_path(upload_id):
+    return os.path.join(UPLOADS_FOLDER, f"{upload_id}.json")
+
+def load_meta(upload_id, user):
+    if not UPLOAD_ID.match(upload_id):
+        abort(404)
+    meta = datastore.read_json(meta_path(upload_id))
+    if not isinstance(meta, dict) or meta.get("user") != user:
+        abort(404)
+    return meta
+
+def open_uploads():
+    """Metadata of every unfinished upload."""
+    metas = []
+    for name in os.listdir(UPLOADS_FOLDER):
+        if name.endswith(".json"):
+            meta = datastore.read_json(os.path.join(UPLOADS_FOLDER, name))
+            if isinstance(meta, dict):
+                metas.append(meta)
+    return metas
+
+def discard(upload_id):
+    for path in (part_path(upload_id), meta_path(upload_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    datastore.cache.invalidate(meta_path(upload_id))
+
+def expire_stale():
+    """Remove uploads nobody has touched for UPLOAD_EXPIRY seconds."""
+    cutoff = time.time() - UPLOAD_EXPIRY
+    upload_ids = {os.path.splitext(name)[0] for name in os.listdir(UPLOADS_FOLDER)}
+    for upload_id in filter(UPLOAD_ID.match, upload_ids):
+        touched = []
+        for path in (part_path(upload_id), meta_path(upload_id)):
+            try:
+                touched.append(os.stat(path).st_mtime)
+            except FileNotFoundError:
+                pass
+        if touched and max(touched) < cutoff:
+            discard(upload_id)
+    _last_expiry[0] = time.monotonic()
+
+def maybe_expire():
+    if time.monotonic() - _last_expiry[0] >= EXPIRE_INTERVAL:
+        expire_stale()
+
+def stop_reading(sock):
+    """End the socket's read side: a blocked read returns at once, and
+    gunicorn closes the connection instead of draining the rest of the body."""
+    try:
+        sock.shutdown(socket.SHUT_RD)
+    except OSError:
+        pass  # already closed
+
+def known_hashes():
+    return {entry.get("sha256") for entry in photo_index.load_index().values()}
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def finish(upload_id, meta):
+    """Check a complete upload and hand it to the ingest worker."""
+    sha256 = file_sha256(part_path(upload_id))
+    if meta.get("sha256") and meta["sha256"] != sha256:
+        discard(upload_id)
+        inc("kensap_uploads_total", {"result": "corrupt"})
+        return jsonify(error="Upload does not match its sha256."), 422
+    if sha256 in known_hashes():
+        discard(upload_id)
+        inc("kensap_uploads_total", {"result": "duplicate"})
+        return jsonify(status="duplicate", filename=meta["filename"])
+    name = ingest.enqueue_file(part_path(upload_id), meta["filename"])
+    discard(upload_id)
+    inc("kensap_uploads_total", {"result": "queued"})
+    return jsonify(status="queued", filename=name)
+
+# -----------------------------
+# Routes
+# -----------------------------
+# POST /uploads {"filename", "size", "sha256"?}  -> {"id", "offset": 0, "chunk"}
+# PUT  /uploads/<id>  Content-Range: bytes a-b/size  -> {"offset"} or the result
+# GET  /uploads/<id>  -> {"offset", "size"}, to resume after a dropped connection
+# Every request carries the login's token in X-Upload-Token (401 without).
+def register_routes(server):
+    @server.before_request
+    def check_upload_token():
+        if request.path == "/uploads" or request.path.startswith("/uploads/"):
+            g.upload_user = token_user()
+            if g.upload_user is None:
+                return jsonify(error="Please log in again to upload photos."), 401
+            maybe_expire()
+
+    @server.route("/uploads", methods=["POST"])
+    def start_upload():
+        user = g.upload_user
+        body = request.get_json(silent=True) or {}
+        filename = secure_filename(str(body.get("filename", "")))
+        size = body.get("size")
+        if not filename.lower().endswith(photo_index.PHOTO_EXTENSIONS):
+            return jsonify(error="Only image files can be uploaded."), 400
+        if not isinstance(size, int) or not 0 < size <= MAX_UPLOAD_BYTES:
+            return jsonify(error=f"Files must be under {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."), 413
+        sha256 = body.get("sha256")
+        if sha256 and sha256 in known_hashes():
+            inc("kensap_uploads_total", {"result": "duplicate"})
+            return jsonify(status="duplicate", filename=filename)
+
+        # One upload starts at a time (across workers), so the caps hold.
+        with open(LOCK_FILE, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            expire_stale()
+            pending = open_uploads()
+            mine = [meta for meta in pending if meta.get("user") == user]
+            if (len(mine) >= MAX_OPEN_UPLOADS_PER_USER
+                    or sum(meta["size"] for meta in mine) + size > MAX_PENDING_BYTES_PER_USER):
+                return jsonify(error="Too many unfinished uploads; wait for them to finish."), 429
+            if sum(meta["size"] for meta in pending) + size > MAX_PENDING_BYTES:
+                response = jsonify(error="The server is busy with other uploads; try again later.")
+                response.headers["Retry-After"] = "60"
+                return response, 503
+
+            upload_id = secrets.token_hex(16)
+            open(part_path(upload_id), "wb").close()
+            datastore.write_json_atomic(meta_path(upload_id),
+                                        {"filename": filename, "size": size, "sha256": sha256, "user": user})
+        return jsonify(id=upload_id, offset=0, chunk=MAX_CHUNK_BYTES), 201
+
+    @server.route("/uploads/<upload_id>", methods=["GET"])
+    def upload_status(upload_id):
+        meta = load_meta(upload_id, g.upload_user)
+        return jsonify(offset=os.path.getsize(part_path(upload_id)), size=meta["size"])
+
+    @server.route("/uploads/<upload_id>", methods=["PUT"])
+    def upload_chunk(upload_id):
+        meta = load_meta(upload_id, g.upload_user)
+        match = CONTENT_RANGE.match(request.headers.get("Content-Range", ""))
+        length = request.content_length
+        if not match or length is None:
+            return jsonify(error="Content-Range and Content-Length are required."), 400
+        start, end, total = (int(g) for g in match.groups())
+        if total != meta["size"] or end < start or end >= total or end - start + 1 != length:
+            return jsonify(error="Content-Range does not match the upload."), 416
+        if length > MAX_CHUNK_BYTES:
+            return jsonify(error="Chunk too large.", chunk=MAX_CHUNK_BYTES), 413
+
+        if not _slots.acquire(blocking=False):
+            response = jsonify(error="Too many uploads in progress.")
+            response.headers["Retry-After"] = "2"
+            return response, 503
+        try:
+            with open(part_path(upload_id), "r+b") as f:
+                if fcntl:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        return jsonify(error="This upload is already receiving a chunk."), 409
+                offset = os.fstat(f.fileno()).st_size
+                if start != offset:
+                    return jsonify(error="Resume from the current offset.", offset=offset), 409
+                f.seek(offset)
+                sock = request.environ.get("gunicorn.socket")
+                cutoff = None
+                if sock is not None:
+                    sock.settimeout(READ_TIMEOUT)  # per read; gunicorn resets it for the next request
+                    cutoff = threading.Timer(CHUNK_DEADLINE, stop_reading, (sock,))
+                    cutoff.start()
+                try:
+                    remaining = length
+                    while remaining:
+                        try:
+                            block = request.stream.read(min(COPY_BUFFER, remaining))
+                        except (ClientDisconnected, OSError):
+                            block = b""  # went away, stalled or past the deadline
+                        if not block:
+                            if sock is not None:
+                                stop_reading(sock)
+                            response = jsonify(error="The chunk arrived too slowly.", offset=f.tell())
+                            response.headers["Connection"] = "close"
+                            return response, 408
+                        f.write(block)
+                        remaining -= len(block)
+                finally:
+                    if cutoff is not None:
+                        cutoff.cancel()
+                offset = f.tell()
+        finally:
+            _slots.release()
+
+        if offset < meta["size"]:
+            return jsonify(offset=offset)
+        return finish(upload_id, meta)
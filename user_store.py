@@ -0,0 +1,182 @@
+import os
+import hmac
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import datastore
+import sqlite_store
+from metrics import timed
+
+# -----------------------------
+# Paths and settings
+# -----------------------------
+# Accounts live in SQLite: login is a primary-key lookup and sign-up is a
+# single INSERT, so concurrent sign-ups across gunicorn workers can't
+# overwrite each other the way rewriting users.json could.
+USERS_DB = "data/users.db"
+LEGACY_USERS_FILE = "data/users.json"
+
+# PBKDF2 work factor. Each login costs one hash, so this sets login latency;
+# hashes made with a different value are upgraded on the next good login.
+PASSWORD_ITERATIONS = int(os.environ.get("PASSWORD_ITERATIONS", "120000"))
+
+LOOKUP_CACHE_SIZE = 10000
+
+os.makedirs("data", exist_ok=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+"""
+
+# -----------------------------
+# Password hashing
+# -----------------------------
+def hash_password(password, iterations=None):
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, password_hash):
+    try:
+        _, iterations, salt, expected = password_hash.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), expected)
+
+def needs_rehash(password_hash):
+    return password_hash.split("$")[1] != str(PASSWORD_ITERATIONS)
+
+# -----------------------------
+# Connections
+# -----------------------------
+_db = sqlite_store.Database(USERS_DB, SCHEMA)
+connect = _db.connect
+close = _db.close
+
+def init_store():
+    _db.init()
+    _db.run_once("legacy_json_migrated", migrate_legacy_json)
+
+def migrate_legacy_json(conn):
+    """Import data/users.json ({username: plaintext password}), hashing as we go,
+    then empty it so the plaintext passwords don't outlive the import."""
+    legacy = sqlite_store.load_legacy_json(LEGACY_USERS_FILE)
+    rows = [(u, hash_password(p)) for u, p in legacy.items()] if isinstance(legacy, dict) else []
+    conn.executemany("INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)", rows)
+    if rows:
+        datastore.write_json_atomic(LEGACY_USERS_FILE, {})
+    return len(rows)
+
+# -----------------------------
+# Cached lookups
+# -----------------------------
+# Username -> password hash (or None for "no such user"). The cache is
+# dropped whenever the database or its write-ahead log changes on disk,
+# which also catches sign-ups made by other workers.
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stamp = [None]
+
+def _db_stamp():
+    stamp = []
+    for path in (USERS_DB, USERS_DB + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+@timed("users", "read")
+def get_password_hash(username):
+    stamp = _db_stamp()
+    with _cache_lock:
+        if stamp != _cache_stamp[0]:
+            _cache.clear()
+            _cache_stamp[0] = stamp
+        if username in _cache:
+            _cache.move_to_end(username)
+            return _cache[username]
+
+    row = connect().execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+    value = row[0] if row else None
+    with _cache_lock:
+        if _cache_stamp[0] == stamp:
+            _cache[username] = value
+            if len(_cache) > LOOKUP_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return value
+
+def user_exists(username):
+    return get_password_hash(username) is not None
+
+# -----------------------------
+# Login and sign-up
+# -----------------------------
+@timed("users", "login")
+def check_login(username, password):
+    password_hash = get_password_hash(username)
+    if password_hash is None or not verify_password(password, password_hash):
+        return False
+    if needs_rehash(password_hash):
+        connect().execute("UPDATE users SET password_hash = ? WHERE username = ?",
+                          (hash_password(password), username))
+    return True
+
+@timed("users", "write")
+def create_user(username, password):
+    """Add an account; return False if the username is already taken."""
+    try:
+        connect().execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                          (username, hash_password(password)))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+# -----------------------------
+# Bulk import and export
+# -----------------------------
+def is_password_hash(value):
+    parts = value.split("$") if isinstance(value, str) else []
+    return len(parts) == 4 and parts[0] == "pbkdf2_sha256" and parts[1].isdigit()
+
+@timed("users", "write")
+def import_users(rows):
+    """Insert (username, password_hash) rows in one transaction, skipping
+    usernames that already exist; return the usernames added."""
+    conn = connect()
+    added = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for username, password_hash in rows:
+            cursor = conn.execute("INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)",
+                                  (username, password_hash))
+            if cursor.rowcount:
+                added.append(username)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+def iter_users(batch=1000):
+    """Yield (username, password_hash) pairs in username order, `batch` per query."""
+    last = ""
+    while True:
+        rows = connect().execute(
+            "SELECT username, password_hash FROM users WHERE username > ? ORDER BY username LIMIT ?",
+            (last, batch)
+        ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+init_store()
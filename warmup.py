@@ -0,0 +1,98 @@
+import gc
+import os
+import sys
+import time
+import threading
+from flask import g, request
+
+import gallery
+import alumni_store
+import comments_store
+import user_store
+import metrics
+
+# -----------------------------
+# Warm start
+# -----------------------------
+# With preload_app (gunicorn.conf.py) the master imports the app, runs
+# run() once and then forks the workers, which start with the photo
+# listing, alumni index, page layouts and Dash's own first-request setup
+# already in memory, shared copy-on-write. Everything warmed here is
+# keyed on file stamps, so a worker forked later (after max_requests)
+# still notices changes made since.
+#
+# The master must not start threads or keep SQLite connections open
+# across fork, so run() only reads, and closes its connections at the end.
+WARM_PAGES = ("/gallery",)
+WARM_URLS = ("/", "/_dash-layout", "/_dash-dependencies")
+
+def report(message):
+    print(f"[warmup {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+def run(server, page_layout, freeze=False):
+    """Load the data stores and build the layouts; return seconds per step."""
+    def photos():
+        return f"{len(gallery.list_photos())} photos"
+
+    def alumni():
+        return f"{alumni_store.version()} alumni"
+
+    def layouts():
+        for pathname in WARM_PAGES:
+            page_layout(pathname)
+        return f"{len(WARM_PAGES)} layouts"
+
+    def dash_setup():
+        client = server.test_client()
+        for url in WARM_URLS:
+            client.get(url)
+        return f"{len(WARM_URLS)} URLs"
+
+    timings = {}
+    started = time.perf_counter()
+    for name, step in (("photos", photos), ("alumni", alumni), ("layouts", layouts), ("dash", dash_setup)):
+        step_started = time.perf_counter()
+        detail = step()
+        timings[name] = time.perf_counter() - step_started
+        report(f"{name}: {detail} in {timings[name] * 1000:.0f} ms")
+    report(f"ready in {time.perf_counter() - started:.2f} s")
+
+    # Keep the master's own numbers, then start the workers from zero.
+    metrics.record_cache_stats()
+    metrics.flush()
+    metrics.reset()
+    user_store.close()
+    comments_store.close()
+    if freeze:
+        # Objects made so far are never touched by the collector again, so
+        # a collection in a worker doesn't copy the shared pages.
+        gc.collect()
+        gc.freeze()
+    return timings
+
+# -----------------------------
+# First request per worker
+# -----------------------------
+_first_request = {"pid": None}
+_first_request_lock = threading.Lock()
+
+def instrument(server):
+    """Log (and export) how long each worker process takes to answer its first request."""
+    @server.before_request
+    def start_first_request_timer():
+        if _first_request["pid"] != os.getpid():
+            g.first_request_started = time.perf_counter()
+
+    @server.after_request
+    def record_first_request(response):
+        started = g.pop("first_request_started", None)
+        if started is None:
+            return response
+        with _first_request_lock:
+            if _first_request["pid"] == os.getpid():
+                return response
+            _first_request["pid"] = os.getpid()
+        seconds = time.perf_counter() - started
+        metrics.observe("kensap_first_request_duration_seconds", {}, seconds)
+        report(f"first request {request.path} in {seconds * 1000:.0f} ms")
+        return response